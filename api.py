@@ -1,15 +1,74 @@
+import collections
+import itertools
+import json
 import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 import requests
 import urllib3
+from requests.adapters import HTTPAdapter
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from urllib3.util.retry import Retry
 import logging
+import numpy as np
 import pandas as pd
-from dateutil import parser  # For more robust datetime parsing
+from datetime import datetime, timezone
 from dotenv import load_dotenv
+from batch import AnnotationBatch, parse_timestamp, parse_timestamps
+from cache import SingleFlight, TTLCache
+from decode import decode_annotations, decode_search_results, loads
+from metrics import REGISTRY, cache_samples, record_response, timed
+from sync import AnnotationSet, LocalEdits, is_provisional, parse_sync_response
+from store import AnnotationStore
+from search import AnnotationIndex, answer_aggregate_question, is_structured_search, parse_aggregate_question
 
 load_dotenv()
 Ocp_Apim_Subscription_Key = os.getenv('Ocp-Apim-Subscription-Key')
 BASE_URL = os.getenv('base_url')
+# How long (seconds) the shared name -> user index is trusted before it is rebuilt
+USER_INDEX_TTL = float(os.getenv('user_index_ttl', 300))
+# Minimum age (seconds) of the index before an unknown name triggers a rebuild
+USER_INDEX_MISS_REFRESH = float(os.getenv('user_index_miss_refresh', 30))
+
+# Shared HTTP client: pooled keep-alive connections, retries and timeouts
+HTTP_POOL_SIZE = int(os.getenv('http_pool_size', 20))
+HTTP_RETRIES = int(os.getenv('http_retries', 3))
+HTTP_BACKOFF = float(os.getenv('http_backoff', 0.5))
+# (connect, read) timeouts in seconds; AI-backed endpoints get a longer read timeout
+HTTP_TIMEOUT = (float(os.getenv('http_connect_timeout', 5)), float(os.getenv('http_read_timeout', 30)))
+HTTP_AI_TIMEOUT = (HTTP_TIMEOUT[0], float(os.getenv('http_ai_read_timeout', 120)))
+
+# Per-user annotation cache: number of users kept (LRU) and seconds before a refetch
+ANNOTATION_CACHE_SIZE = int(os.getenv('annotation_cache_size', 256))
+ANNOTATION_CACHE_TTL = float(os.getenv('annotation_cache_ttl', 60))
+# 'delta' revalidates an expired entry with ?since=<watermark> / If-None-Match,
+# 'full' always downloads the whole history again
+ANNOTATION_SYNC = os.getenv('annotation_sync', 'delta')
+# Search results kept per (user, normalized query) and seconds they stay valid
+SEARCH_CACHE_SIZE = int(os.getenv('search_cache_size', 512))
+SEARCH_CACHE_TTL = float(os.getenv('search_cache_ttl', 120))
+# Answer structured searches from the cached annotations when they are fresh
+LOCAL_SEARCH = os.getenv('local_search', 'on') == 'on'
+# 'auto' tries POST .../wasteannotations/batch first, 'off' always posts one by one
+ANNOTATION_BATCH = os.getenv('annotation_batch', 'auto')
+# Annotations persisted on disk per user, for fast cold starts ('' disables)
+ANNOTATION_STORE_DIR = os.getenv(
+    'annotation_store_dir',
+    os.path.join(os.path.expanduser('~'), '.cache', 'foodmeter', 'annotations')
+)
+ANNOTATION_STORE_MAX_BYTES = int(os.getenv('annotation_store_max_mb', 512)) * 1024 * 1024
+# Users not seen for this many days lose their on-disk copy
+ANNOTATION_STORE_MAX_IDLE = float(os.getenv('annotation_store_max_idle_days', 30)) * 86400
+# Background GETs revalidating copies served from the store at cold start
+ANNOTATION_REFRESH_WORKERS = int(os.getenv('annotation_refresh_workers', 2))
+# Price history frames kept per process (one entry per user and data version)
+PRICE_HISTORY_CACHE_SIZE = int(os.getenv('price_history_cache_size', 64))
+# Accept-Encoding override, e.g. 'identity'; by default requests already asks for
+# every encoding it can decode here (gzip, deflate, br with brotli installed)
+HTTP_ACCEPT_ENCODING = os.getenv('http_accept_encoding')
 
 # Configure headers
 HEADERS = {
@@ -29,170 +88,712 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 #BASE_URL = "https://localhost:51088/api"
 #BASE_URL = "https://foodmeterapiapi.azure-api.net/api"
 
+class GatewayRetry(Retry):
+    """Retry policy of the shared session.
+
+    Idempotent requests are retried on 429 and 503. POST and PATCH are
+    retried on 429 only: the gateway's rate limit rejects them before the
+    backend sees them, while a 503 may come after the backend already
+    created the annotation.
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if status_code == 429 and bool(self.total):
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+@st.cache_resource
 def create_session():
+    """Return the HTTP session shared by every Streamlit session in this process.
+
+    Streamlit reruns app.py on every interaction, so the session is cached to
+    keep its pooled keep-alive connections to the gateway open across reruns.
+    Rejected requests are retried with exponential backoff, honouring
+    Retry-After (see GatewayRetry for which ones).
+    """
+    retry = GatewayRetry(
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF,
+        status_forcelist=(429, 503),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_SIZE,
+        pool_maxsize=HTTP_POOL_SIZE,
+        pool_block=True,
+        max_retries=retry,
+    )
 
     # Create a session that skips certificate verification
     session = requests.Session()
     session.verify = False
     session.headers.update(HEADERS)
+    if HTTP_ACCEPT_ENCODING:
+        session.headers['Accept-Encoding'] = HTTP_ACCEPT_ENCODING
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # Latency and payload size of every call, per endpoint
+    session.hooks['response'].append(record_response)
     logging.disable(logging.DEBUG)
     return session
 
-def get_user_by_username(session, username):
-    """Get user details by username"""
+class UserIndex:
+    """Process-wide name -> user index built from a single GET /users"""
+
+    def __init__(self, ttl=USER_INDEX_TTL):
+        self.ttl = ttl
+        # None until we know whether the API honours GET /users?name=...
+        self.server_filter = None
+        self.refresh_lock = threading.Lock()
+        self._users = {}
+        self._loaded_at = None
+
+    def age(self):
+        if self._loaded_at is None:
+            return float('inf')
+        return time.monotonic() - self._loaded_at
+
+    def is_stale(self):
+        return self.age() > self.ttl
+
+    def load(self, users):
+        index = {}
+        for user in users:
+            # Keep the first match, as the old linear scan did
+            index.setdefault(user.get('name'), user)
+        self._users = index
+        self._loaded_at = time.monotonic()
+
+    def get(self, username):
+        return self._users.get(username)
+
+@st.cache_resource
+def get_user_index():
+    """Return the user index shared by every Streamlit session in this process"""
+    return UserIndex()
+
+def _fetch_users(session, params=None):
+    """GET /users, optionally filtered; returns the list or None on failure"""
     try:
-        logging.debug(f"Requesting: GET {BASE_URL}/users")
-        response = session.get(f"{BASE_URL}/users")
+        logging.debug(f"Requesting: GET {BASE_URL}/users {params or ''}")
+        response = session.get(f"{BASE_URL}/users", params=params, timeout=HTTP_TIMEOUT)
         
         logging.debug(f"Response status: {response.status_code}")
-        logging.debug(f"Response body: {response.text}")
+        logging.debug(f"Response size: {len(response.content)} bytes")
         
         if response.status_code == 200:
-            users = response.json()
-            # Match by name instead of username since that's what the API returns
-            for user in users:
-                if user.get('name') == username:  # Changed from 'username' to 'name'
-                    return user
+            return loads(response.content)
         else:
             st.error(f"API Error: {response.status_code} - {response.text}")
     except requests.exceptions.RequestException as e:
         st.error(f"Connection error: {str(e)}")
     return None
 
+def _refresh_user_index(session, index, max_age):
+    """Rebuild the index unless another session did so within max_age seconds"""
+    with index.refresh_lock:
+        if index.age() > max_age:
+            users = _fetch_users(session)
+            if users is not None:
+                index.load(users)
+
+@timed('foodmeter_api_call_seconds', function='get_user_by_username')
+def get_user_by_username(session, username):
+    """Get user details by username"""
+    index = get_user_index()
+
+    # Preferred path: let the API filter, so only the matching user is sent back
+    if index.server_filter is not False:
+        users = _fetch_users(session, params={'name': username})
+        if users is None:
+            return None
+        # Match by name instead of username since that's what the API returns
+        if all(user.get('name') == username for user in users):
+            index.server_filter = True
+            return users[0] if users else None
+        # The filter was ignored and we got the full list: index it and stop asking
+        index.server_filter = False
+        index.load(users)
+        return index.get(username)
+
+    if index.is_stale():
+        _refresh_user_index(session, index, index.ttl)
+    user = index.get(username)
+    if user is None:
+        # Possibly a user created after the index was built
+        _refresh_user_index(session, index, USER_INDEX_MISS_REFRESH)
+        user = index.get(username)
+    return user
+
+@st.cache_resource
+def get_annotation_cache():
+    """Return the per-user annotation cache shared by every Streamlit session"""
+    return TTLCache(maxsize=ANNOTATION_CACHE_SIZE, ttl=ANNOTATION_CACHE_TTL)
+
+@st.cache_resource
+def get_annotation_store():
+    """On-disk annotation store shared by every session, or None when disabled"""
+    if not ANNOTATION_STORE_DIR:
+        return None
+    try:
+        return AnnotationStore(ANNOTATION_STORE_DIR, ANNOTATION_STORE_MAX_BYTES, ANNOTATION_STORE_MAX_IDLE)
+    except OSError as e:
+        logging.warning(f"Annotation store disabled, cannot use {ANNOTATION_STORE_DIR}: {e}")
+        return None
+
+@st.cache_resource
+def get_local_edits():
+    """Optimistic adds and deletes in flight, shared by every session.
+
+    Confirmed ones are kept as long as a sync GET can take, retries included.
+    """
+    return LocalEdits(keep=sum(HTTP_TIMEOUT) * (HTTP_RETRIES + 1))
+
+@st.cache_resource
+def get_refresh_executor():
+    """Thread pool revalidating annotations served from the on-disk store"""
+    return ThreadPoolExecutor(max_workers=ANNOTATION_REFRESH_WORKERS, thread_name_prefix='annotation-refresh')
+
+def submit_in_script_context(executor, func, *args):
+    """executor.submit with the calling script's context attached to the worker.
+
+    Background work reaches st.cache_resource accessors (the annotation and
+    search caches, the executors themselves), which warn on threads without one.
+    """
+    return executor.submit(_run_in_context, get_script_run_ctx(suppress_warning=True), func, *args)
+
+def _run_in_context(ctx, func, *args):
+    # Pool threads keep the last context; background work makes no UI calls that would use it
+    add_script_run_ctx(threading.current_thread(), ctx)
+    return func(*args)
+
+def annotation_cache_stats():
+    """Hit, miss and eviction counters of the annotation cache"""
+    return get_annotation_cache().stats()
+
+def _api_cache_samples():
+    return (
+        cache_samples('annotations', get_annotation_cache().stats())
+        + cache_samples('search', get_search_cache().stats())
+    )
+
+REGISTRY.add_collector(_api_cache_samples)
+
 def get_waste_annotations(session, user_id):
-    """Fetch waste annotations for a user"""
+    """Fetch waste annotations for a user, as an AnnotationBatch.
+
+    Results are cached per user; the returned batch is shared between
+    sessions. Once the cached copy expires only the changes since the last
+    sync are requested and merged into it.
+    """
+    return get_waste_annotation_set(session, user_id).batch
+
+@timed('foodmeter_api_call_seconds', function='get_waste_annotation_set')
+def get_waste_annotation_set(session, user_id):
+    """Like get_waste_annotations, but return the AnnotationSet with its version"""
+    cache = get_annotation_cache()
+    current = cache.get(user_id)
+    if current is not None:
+        return current
+
+    store = get_annotation_store()
+    stale = None
+    if ANNOTATION_SYNC == 'delta':
+        stale = cache.peek(user_id)
+        if stale is None and store is not None:
+            stored = store.load(user_id)
+            if stored is not None:
+                # Cold start: show the copy on disk at once and revalidate it in the background
+                return _serve_stored_annotations(session, user_id, stored)
+    started = time.monotonic()
+    synced = _sync_waste_annotations(session, user_id, stale)
+    if synced is None:
+        # Better an out of date list than an empty page when the API is down
+        return stale if stale is not None else AnnotationSet(AnnotationBatch.from_records([]))
+    return _cache_synced_annotations(user_id, stale, synced, started)
+
+def _cache_synced_annotations(user_id, stale, synced, started):
+    """Cache a sync result and persist it when it changed; started is when its GET began"""
+    edits = get_local_edits()
+    with edits.lock:
+        # Keep optimistic edits, including those the API answered while we were syncing
+        synced = edits.apply(user_id, synced, started)
+        get_annotation_cache().set(user_id, synced)
+    store = get_annotation_store()
+    if store is not None and (stale is None or synced.version != stale.version):
+        store.save(user_id, synced)
+    return synced
+
+def _serve_stored_annotations(session, user_id, stored):
+    """Cache the on-disk copy of a user's annotations and queue its revalidation"""
+    edits = get_local_edits()
+    with edits.lock:
+        current = get_annotation_cache().peek(user_id)
+        if current is not None:
+            # Another session got there first
+            return current
+        # The copy on disk may predate every edit still remembered
+        current = edits.apply(user_id, stored, 0)
+        get_annotation_cache().set(user_id, current)
+    with _refreshes_lock:
+        running = _refreshes.get(user_id)
+        if running is None or running.done():
+            future = submit_in_script_context(
+                get_refresh_executor(), _refresh_waste_annotations, session, user_id, stored
+            )
+            _refreshes[user_id] = future
+        else:
+            future = None
+    if future is not None:
+        future.add_done_callback(lambda done: _forget_refresh(user_id, done))
+    return current
+
+# Background revalidations per user_id, so a user is refreshed once at a time
+_refreshes = {}
+_refreshes_lock = threading.Lock()
+
+def _forget_refresh(user_id, future):
+    with _refreshes_lock:
+        if _refreshes.get(user_id) is future:
+            del _refreshes[user_id]
+
+def _refresh_waste_annotations(session, user_id, stored):
+    started = time.monotonic()
+    synced = _sync_waste_annotations(session, user_id, stored, report_error=logging.warning)
+    if synced is not None:
+        _cache_synced_annotations(user_id, stored, synced, started)
+
+def _sync_waste_annotations(session, user_id, current=None, report_error=st.error):
+    """Full or delta GET of a user's annotations; returns an AnnotationSet or None.
+
+    Failures go to report_error, st.error unless called off the script thread.
+    """
+    params = {}
+    headers = {}
+    if current is not None:
+        if current.watermark:
+            params['since'] = current.watermark
+        if current.etag:
+            headers['If-None-Match'] = current.etag
     try:
-        logging.debug(f"Requesting: GET {BASE_URL}/users/{user_id}/wasteannotations")
-        response = session.get(f"{BASE_URL}/users/{user_id}/wasteannotations")
+        logging.debug(f"Requesting: GET {BASE_URL}/users/{user_id}/wasteannotations {params}")
+        response = session.get(
+            f"{BASE_URL}/users/{user_id}/wasteannotations",
+            params=params,
+            headers=headers,
+            timeout=HTTP_TIMEOUT
+        )
         
         logging.debug(f"Response status: {response.status_code}")
-        logging.debug(f"Response body: {response.text}")
+        logging.debug(f"Response size: {len(response.content)} bytes")
         
+        if response.status_code == 304:
+            return current
         if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"API Error: {response.status_code} - {response.text}")
+            return parse_sync_response(current, decode_annotations(response.content), response.headers.get('ETag'))
+        report_error(f"API Error: {response.status_code} - {response.text}")
     except requests.exceptions.RequestException as e:
-        st.error(f"Connection error: {str(e)}")
-    return []
+        report_error(f"Connection error: {str(e)}")
+    return None
 
 def create_waste_annotation(session, user_id, annotation_data):
     """Create a new food annotation"""
+    with st.spinner("Processing request... This may take a while."):   
+        created, error = post_waste_annotation(session, user_id, annotation_data)
+    if not created:
+        st.error(error)
+    return created
+
+@timed('foodmeter_api_call_seconds', function='post_waste_annotation')
+def post_waste_annotation(session, user_id, annotation_data, replaces=None):
+    """POST a new annotation without touching the UI; safe to call from worker threads.
+
+    replaces is the provisional id the annotation was shown under, if any
+    (see add_cached_annotation); the created annotation takes its place.
+    Returns (created, error message or None).
+    """
     try:
         logging.debug(f"Requesting: POST {BASE_URL}/users/{user_id}/wasteannotations")
         logging.debug(f"Request body: {annotation_data}")
         
-        with st.spinner("Processing request... This may take a while."):   
-            response = session.post(
-                f"{BASE_URL}/users/{user_id}/wasteannotations",
-                json=annotation_data
-            )
+        response = session.post(
+            f"{BASE_URL}/users/{user_id}/wasteannotations",
+            json=annotation_data,
+            timeout=HTTP_AI_TIMEOUT
+        )
         
         logging.debug(f"Response status: {response.status_code}")
-        logging.debug(f"Response body: {response.text}")
+        logging.debug(f"Response size: {len(response.content)} bytes")
         
-        return response.status_code == 200 or response.status_code == 201  
+        if response.status_code == 200 or response.status_code == 201:
+            _cache_created_annotation(user_id, response, replaces)
+            invalidate_searches(user_id)
+            return True, None
+        return False, f"API Error: {response.status_code} - {response.text}"
     except requests.exceptions.RequestException as e:
-        st.error(f"Connection error: {str(e)}")
-        return False
+        return False, f"Connection error: {str(e)}"
+
+# None until we know whether the API has POST .../wasteannotations/batch
+_batch_endpoint_supported = None
+
+@timed('foodmeter_api_call_seconds', function='post_waste_annotations_batch')
+def post_waste_annotations_batch(session, user_id, annotations):
+    """POST several annotations in one request; safe to call from worker threads.
+
+    Returns a (created, error) pair per annotation, in order, or None when the
+    API has no batch endpoint and the caller should post them one by one.
+    """
+    global _batch_endpoint_supported
+    if ANNOTATION_BATCH == 'off' or _batch_endpoint_supported is False:
+        return None
+    try:
+        logging.debug(f"Requesting: POST {BASE_URL}/users/{user_id}/wasteannotations/batch")
+        logging.debug(f"Request body: {annotations}")
+        
+        response = session.post(
+            f"{BASE_URL}/users/{user_id}/wasteannotations/batch",
+            json=annotations,
+            timeout=HTTP_AI_TIMEOUT
+        )
+        
+        logging.debug(f"Response status: {response.status_code}")
+        logging.debug(f"Response size: {len(response.content)} bytes")
+        
+        if response.status_code in (404, 405):
+            _batch_endpoint_supported = False
+            return None
+        if response.status_code != 200 and response.status_code != 201:
+            error = f"API Error: {response.status_code} - {response.text}"
+            return [(False, error)] * len(annotations)
+        _batch_endpoint_supported = True
+        invalidate_searches(user_id)
+        try:
+            created_annotations = loads(response.content)
+        except requests.exceptions.InvalidJSONError:
+            created_annotations = None
+        if not isinstance(created_annotations, list):
+            # The server created them but did not say what: refetch the list
+            # instead of reporting failures that a retry would duplicate
+            get_annotation_cache().pop(user_id)
+            return [(True, "Created, but not returned by the API")] * len(annotations)
+        results = []
+        edits = get_local_edits()
+        for created in created_annotations:
+            if isinstance(created, dict) and 'id' in created:
+                with edits.lock:
+                    edits.resolve(user_id, None, created=created)
+                    get_annotation_cache().update(user_id, lambda current: current.with_annotation(created))
+                results.append((True, None))
+            else:
+                error = created.get('error') if isinstance(created, dict) else None
+                results.append((False, error or "Not created"))
+        return results
+    except requests.exceptions.RequestException as e:
+        return [(False, f"Connection error: {str(e)}")] * len(annotations)
+
+def _cache_created_annotation(user_id, response, replaces=None):
+    """Append the annotation returned by the API to the cached list, or invalidate it"""
+    try:
+        annotation = response.json()
+    except ValueError:
+        annotation = None
+    cache = get_annotation_cache()
+    edits = get_local_edits()
+    with edits.lock:
+        if isinstance(annotation, dict) and 'id' in annotation:
+            edits.resolve(user_id, replaces, created=annotation, deleted=replaces)
+            # One update, so no rerun sees both the provisional and the created row
+            deleted = [] if replaces is None else [replaces]
+            cache.update(user_id, lambda current: current.merge([annotation], deleted, watermark=current.watermark))
+        else:
+            edits.resolve(user_id, replaces, deleted=replaces)
+            cache.pop(user_id)
+
+# Ids of annotations shown before the API confirmed them; negative, so they never clash with real ones
+_provisional_ids = itertools.count(-1, -1)
+
+def add_cached_annotation(user_id, annotation_data):
+    """Show annotation_data in the cached list right away, ahead of its POST.
+
+    Returns the provisional id it is shown under, to pass to
+    post_waste_annotation(replaces=...), or to discard_cached_annotation if
+    the POST fails. Syncs keep the row until then (see LocalEdits).
+    """
+    annotation = dict(
+        annotation_data,
+        id=next(_provisional_ids),
+        timestamp=datetime.now(timezone.utc).isoformat()
+    )
+    edits = get_local_edits()
+    with edits.lock:
+        edits.add(user_id, annotation)
+        get_annotation_cache().update(user_id, lambda current: current.with_annotation(annotation))
+    return annotation['id']
+
+def discard_cached_annotation(user_id, provisional_id):
+    """Undo add_cached_annotation after the POST failed"""
+    edits = get_local_edits()
+    with edits.lock:
+        edits.resolve(user_id, provisional_id)
+        get_annotation_cache().update(user_id, lambda current: current.without(provisional_id))
+
+def remove_cached_annotation(user_id, annotation_id):
+    """Drop an annotation from the cached list ahead of its DELETE.
+
+    Returns the removed rows (an AnnotationBatch) for restore_cached_annotation,
+    or None when the user has no cached list.
+    """
+    removed = []
+    def remove(current):
+        removed.append(current.batch.take(current.batch.ids == annotation_id))
+        return current.without(annotation_id)
+    edits = get_local_edits()
+    with edits.lock:
+        edits.delete(user_id, annotation_id)
+        get_annotation_cache().update(user_id, remove)
+    return removed[0] if removed else None
+
+def restore_cached_annotation(user_id, annotation_id, rows):
+    """Undo remove_cached_annotation after the API refused the DELETE"""
+    edits = get_local_edits()
+    with edits.lock:
+        edits.resolve(user_id, annotation_id)
+        if rows is not None and len(rows):
+            get_annotation_cache().update(user_id, lambda current: current.restore(rows))
 
 def delete_waste_annotation(session, user_id, annotation_id):
     """Delete a waste annotation"""
+    deleted, error = remove_waste_annotation(session, user_id, annotation_id)
+    if not deleted:
+        st.error(error)
+    return deleted
+
+@timed('foodmeter_api_call_seconds', function='remove_waste_annotation')
+def remove_waste_annotation(session, user_id, annotation_id):
+    """DELETE an annotation without touching the UI; safe to call from worker threads.
+
+    Returns (deleted, error message or None).
+    """
     try:
         logging.debug(f"Requesting: DELETE {BASE_URL}/users/{user_id}/wasteannotations/{annotation_id}")
         response = session.delete(
-            f"{BASE_URL}/users/{user_id}/wasteannotations/{annotation_id}"
+            f"{BASE_URL}/users/{user_id}/wasteannotations/{annotation_id}",
+            timeout=HTTP_TIMEOUT
         )
         
         logging.debug(f"Response status: {response.status_code}")
-        logging.debug(f"Response body: {response.text}")
+        logging.debug(f"Response size: {len(response.content)} bytes")
         
-        return response.status_code == 200
+        if response.status_code == 200:
+            edits = get_local_edits()
+            with edits.lock:
+                edits.resolve(user_id, annotation_id, deleted=annotation_id)
+                get_annotation_cache().update(user_id, lambda current: current.without(annotation_id))
+            invalidate_searches(user_id)
+            return True, None
+        return False, f"API Error: {response.status_code} - {response.text}"
     except requests.exceptions.RequestException as e:
-        st.error(f"Connection error: {str(e)}")
-        return False
+        return False, f"Connection error: {str(e)}"
 
 # =================================================================================================
 # New code for price history analysis
 # =================================================================================================
 
-def parse_timestamp(timestamp_str):
-    """Parse timestamp string to datetime object using dateutil parser"""
-    try:
-        return parser.parse(timestamp_str)
-    except (ValueError, TypeError):
+@timed('foodmeter_api_call_seconds', function='get_price_history_data')
+def get_price_history_data(batch):
+    """Process an AnnotationBatch into a format suitable for plotting"""
+    item_names = batch.item_names
+    # Keep annotations with a (truthy) item name, price and timestamp
+    keep = (
+        (item_names.codes >= 0) & ~np.isin(item_names.codes, np.flatnonzero(item_names.categories == ''))
+        & ~np.isnan(batch.prices) & (batch.prices != 0)
+        & ~np.isnat(batch.timestamps)
+    )
+    if not keep.any():
         return None
 
-def get_price_history_data(annotations):
-    """Process annotations into a format suitable for plotting"""
-    # Convert annotations to DataFrame
-    data = []
-    for ann in annotations:
-        if ann.get('itemName') and ann.get('price') and ann.get('timestamp'):
-            data.append({
-                'itemName': ann['itemName'],
-                'price': float(ann['price']),
-                'timestamp': parse_timestamp(ann['timestamp']),
-                'annotation_name': ann['name']
-            })
-    
-    df = pd.DataFrame(data)
-    return df if not df.empty else None
-
-def get_price_history_data(annotations):
-    """Process annotations into a format suitable for plotting"""
-    # Convert annotations to DataFrame
-    data = []
-    for ann in annotations:
-        if ann.get('itemName') and ann.get('price') and ann.get('timestamp'):
-            data.append({
-                'itemName': ann['itemName'],
-                'price': float(ann['price']),
-                'timestamp': parse_timestamp(ann['timestamp']),
-                'annotation_name': ann['name'],
-                'quantity': float(ann.get('quantity', 1))  # Default to 1 if quantity not provided
-            })
-    
-    df = pd.DataFrame(data)
-    if not df.empty:
-        df = df.sort_values('timestamp')
-        # Calculate total spent (price * quantity)
-        df['total_spent'] = df['price'] * df['quantity']
-        # Calculate cumulative sum for each item
-        df['cumulative_sum'] = df.groupby('itemName')['total_spent'].cumsum()
-        # Calculate overall cumulative sum
-        df['overall_cumulative_sum'] = df['total_spent'].cumsum()
+    df = pd.DataFrame({
+        'itemName': item_names[keep].remove_unused_categories(),
+        'price': batch.prices[keep],
+        'timestamp': batch.timestamps[keep],
+        'annotation_name': batch.names[keep],
+        # Default to 1 if quantity not provided
+        'quantity': np.nan_to_num(batch.quantities[keep], nan=1.0),
+    })
+    df = df.sort_values('timestamp', kind='stable', ignore_index=True)
+    # Calculate total spent (price * quantity)
+    df['total_spent'] = df['price'] * df['quantity']
+    # Calculate cumulative sum for each item
+    df['cumulative_sum'] = df.groupby('itemName', sort=False, observed=True)['total_spent'].cumsum()
+    # Calculate overall cumulative sum
+    df['overall_cumulative_sum'] = df['total_spent'].cumsum()
+    return df
+
+def get_price_history_summary(df):
+    """Total spent and quantity per item, with each item's share of the total"""
+    total_spent = df['total_spent'].sum()
+    summary_by_item = df.groupby('itemName', observed=True).agg({
+        'total_spent': 'sum',
+        'quantity': 'sum'
+    }).round(2)
     
-    return df if not df.empty else None
+    summary_by_item.columns = ['Total Spent', 'Total Quantity']
+    summary_by_item['Percentage of Total'] = (
+        summary_by_item['Total Spent'] / total_spent * 100
+    ).round(2)
+    return summary_by_item
+
+@st.cache_resource(max_entries=PRICE_HISTORY_CACHE_SIZE, show_spinner=False)
+def get_price_history_frames(user_id, data_version, _batch):
+    """Price history DataFrames for one version of a user's annotations.
+
+    Cached on (user_id, data_version), so reruns that do not change the data
+    (switching items or tabs) reuse the frames instead of rebuilding them.
+    The frames are shared between sessions and must be treated as read-only.
+    Returns None when there is no priced annotation.
+    """
+    df = get_price_history_data(_batch)
+    if df is None:
+        return None
+    # Row positions of each item; df is sorted by time, so each slice is too
+    item_rows = df.groupby('itemName', sort=True, observed=True).indices
+    return {
+        'df': df,
+        'items': list(item_rows),
+        'item_rows': item_rows,
+        'total_spent': df['total_spent'].sum(),
+        'summary_by_item': get_price_history_summary(df),
+    }
+
+def get_item_history(frames, item):
+    """Rows of one item from get_price_history_frames, in time order, without scanning df"""
+    return frames['df'].iloc[frames['item_rows'][item]]
 
 # =================================================================================================
 # Waste Annotation Search Endpoint Integration
 # =================================================================================================
 
+@st.cache_resource
+def get_search_cache():
+    """Search results per (user_id, normalized search_params), shared by every session"""
+    return TTLCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+
+@st.cache_resource
+def get_search_flights():
+    """Coalesces identical searches that are in flight at the same time"""
+    return SingleFlight()
+
+def normalize_search_params(search_params):
+    """Canonical form of search_params, so equivalent searches share a cache entry"""
+    normalized = {
+        key: re.sub(r'\s+', ' ', value).strip().lower() if isinstance(value, str) else value
+        for key, value in search_params.items()
+        if value is not None and value != ''
+    }
+    return json.dumps(normalized, sort_keys=True)
+
+# user_id -> number of invalidate_searches calls, so a search that was in flight
+# meanwhile does not cache results from before the change
+_search_generations = collections.Counter()
+_search_generations_lock = threading.Lock()
+
+def invalidate_searches(user_id):
+    """Forget cached search results of a user whose annotations changed"""
+    with _search_generations_lock:
+        _search_generations[user_id] += 1
+        get_search_cache().discard(lambda key: key[0] == user_id)
+
+@st.cache_resource(max_entries=PRICE_HISTORY_CACHE_SIZE, show_spinner=False)
+def get_annotation_index(user_id, data_version, _batch):
+    """Local search index for one version of a user's annotations"""
+    return AnnotationIndex(_batch)
+
+def search_local_annotations(user_id, search_params):
+    """Answer a search from the cached annotations.
+
+    Handles structured filters and simple aggregate questions ("total price
+    of apple in the last 15 days"). Returns None when the search needs the
+    server: other free-text queries, unknown items, or no fresh local copy of
+    the user's annotations.
+    """
+    if not LOCAL_SEARCH:
+        return None
+    question = None
+    if set(search_params) == {'query'}:
+        question = parse_aggregate_question(search_params['query'])
+        if question is None:
+            return None
+    elif not is_structured_search(search_params):
+        return None
+    current = get_annotation_cache().get(user_id)
+    if current is None:
+        return None
+    index = get_annotation_index(user_id, current.version, current.batch)
+    if question is not None:
+        results = answer_aggregate_question(index, question)
+        if results is not None:
+            REGISTRY.inc('foodmeter_local_search_total', kind='aggregate')
+        return results
+    REGISTRY.inc('foodmeter_local_search_total', kind='structured')
+    return {'reply': None, 'wasteAnnotations': index.search(search_params).to_frame()}
+
+@timed('foodmeter_api_call_seconds', function='search_waste_annotations')
 def search_waste_annotations(session, user_id, search_params):
-    """Search waste annotations for a user"""
+    """Search waste annotations for a user.
+
+    Structured filters are answered locally while the cached annotations are
+    fresh. Server results are cached for search_cache_ttl seconds per user and
+    normalized query, and dropped when the user creates or deletes an
+    annotation. Identical searches running concurrently share one request.
+    """
+    results = search_local_annotations(user_id, search_params)
+    if results is not None:
+        return results
+
+    key = (user_id, normalize_search_params(search_params))
+    results = get_search_cache().get(key)
+    if results is not None:
+        return results
+
+    with st.spinner("Searching annotations... This may take a while."):   
+        results, error = get_search_flights().do(
+            key,
+            lambda: _post_search(session, user_id, search_params, key)
+        )
+    if error:
+        st.error(error)
+    return results
+
+def _post_search(session, user_id, search_params, key):
+    """POST .../wasteannotations/search; returns (results, error message)"""
+    generation = _search_generations[user_id]
     try:
         logging.debug(f"Requesting: POST {BASE_URL}/users/{user_id}/wasteannotations/search")
         logging.debug(f"Request body: {search_params}")
         
-        with st.spinner("Searching annotations... This may take a while."):   
-            response = session.post(
-                f"{BASE_URL}/users/{user_id}/wasteannotations/search",
-                json=search_params
-            )
+        response = session.post(
+            f"{BASE_URL}/users/{user_id}/wasteannotations/search",
+            json=search_params,
+            timeout=HTTP_AI_TIMEOUT
+        )
         
         logging.debug(f"Response status: {response.status_code}")
-        logging.debug(f"Response body: {response.text}")
+        logging.debug(f"Response size: {len(response.content)} bytes")
         
         if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Search Error: {response.status_code} - {response.text}")
-            return None
+            results = decode_search_results(response.content)
+            if isinstance(results, dict) and results.get('wasteAnnotations') is not None:
+                # Same form as local results: a frame of typed columns, not a list of dicts
+                results['wasteAnnotations'] = AnnotationBatch.from_records(results['wasteAnnotations']).to_frame()
+            with _search_generations_lock:
+                if _search_generations[user_id] == generation:
+                    get_search_cache().set(key, results)
+            return results, None
+        return None, f"Search Error: {response.status_code} - {response.text}"
     except requests.exceptions.RequestException as e:
-        st.error(f"Connection error: {str(e)}")
-        return None
+        return None, f"Connection error: {str(e)}"
       
+@timed('foodmeter_api_call_seconds', function='increment_user_ops')
 def increment_user_ops(session, user_id: int) -> bool:
     """
     Increment the NumberOfOps for a specific user
@@ -209,7 +810,7 @@ def increment_user_ops(session, user_id: int) -> bool:
     url = f"{BASE_URL}/api/users/{user_id}/increment-ops"
     
     try:
-        response = session.patch(url)
+        response = session.patch(url, timeout=HTTP_TIMEOUT)
         
         if response.status_code == 204:
             return True
@@ -15,6 +15,9 @@ from datetime import datetime
 from dotenv import load_dotenv
 from api import *
 from audio import *
+from charts import *
+from jobs import *
+from metrics import METRICS_TEXTFILE, REGISTRY, stage
 
 st.set_page_config(page_icon="icon.jpg")
 
@@ -72,6 +75,177 @@ def verify_access_token():
     valid_token = st.secrets["access_token"]
     return access_token == valid_token
 
+FOOD_ITEM_PAGE_SIZES = [10, 25, 50, 100]
+FOOD_ITEM_COLUMNS = ['name', 'description', 'itemName', 'price', 'quantity', 'timestamp']
+
+def render_food_items(session, annotations):
+    """Render one page of the user's annotations (an AnnotationBatch), as expanders or as a table"""
+    view_col, size_col, page_col = st.columns([2, 1, 1])
+    with view_col:
+        view = st.radio("View", ["List", "Table"], horizontal=True, key="food_items_view")
+    with size_col:
+        page_size = st.selectbox("Items per page", FOOD_ITEM_PAGE_SIZES, index=1, key="food_items_page_size")
+    page_count = max(1, -(-len(annotations) // page_size))
+    # A delete or a larger page size can leave the stored page out of range
+    if st.session_state.get("food_items_page", 1) > page_count:
+        st.session_state.food_items_page = page_count
+    with page_col:
+        page_number = st.number_input("Page", min_value=1, max_value=page_count, key="food_items_page")
+    start = (page_number - 1) * page_size
+    page_batch = annotations[start:start + page_size]
+    st.caption(f"Showing {start + 1}-{start + len(page_batch)} of {len(annotations)} food items")
+
+    if view == "Table":
+        page_df = page_batch.to_frame(FOOD_ITEM_COLUMNS + ['id'])
+        selection = st.dataframe(
+            page_df[FOOD_ITEM_COLUMNS],
+            hide_index=True,
+            use_container_width=True,
+            on_select="rerun",
+            selection_mode="multi-row",
+            # A new key after each delete, so the selection does not move to the rows that took their place
+            key=f"food_items_table_{page_number}_{st.session_state.get('food_items_deletes', 0)}"
+        )
+        selected = page_df.iloc[selection.selection.rows]
+        selected_items = [
+            (annotation_id, description)
+            for annotation_id, description in zip(selected['id'].tolist(), selected['description'].tolist())
+            if not is_provisional(annotation_id)
+        ]
+        st.button(
+            f"Delete selected ({len(selected_items)})",
+            disabled=not selected_items,
+            on_click=delete_food_items,
+            args=(session, selected_items)
+        )
+        return
+
+    for annotation in page_batch.to_records():
+        with st.expander(f"Food Items: {annotation.get('name', 'N/A')}"):
+            # Expander bodies are sent even while collapsed: keep them to one element
+            details = [f"Description: {annotation.get('description', 'N/A')}"]
+            if annotation.get('itemName'):
+                details.append(f"Item Name: {annotation['itemName']}")
+            if annotation.get('price'):
+                details.append(f"Price: {annotation['price']}")
+            if annotation.get('quantity'):
+                details.append(f"Quantity: {annotation['quantity']:g}")
+            if annotation.get('timestamp'):
+                details.append(f"Timestamp: {annotation['timestamp']}")
+            st.markdown("  \n".join(details))
+            
+            st.button(
+                "Delete",
+                key=f"delete_{annotation['id']}",
+                # Not created yet: there is nothing to delete on the server
+                disabled=is_provisional(annotation['id']),
+                on_click=delete_food_items,
+                args=(session, [(annotation['id'], annotation.get('description'))])
+            )
+
+def delete_food_items(session, items):
+    """Delete button callback: the items leave the list before the rerun, DELETEs run in the background"""
+    for annotation_id, description in items:
+        submit_annotation_delete(
+            session,
+            st.session_state.user_id,
+            annotation_id,
+            description,
+            st.session_state.submission_jobs
+        )
+    st.session_state.food_items_deletes = st.session_state.get('food_items_deletes', 0) + 1
+
+def add_food_item(session):
+    """Add Food Item callback: the item is listed before the rerun, the POST runs in the background"""
+    price = st.session_state.new_annotation_price
+    quantity = st.session_state.new_annotation_quantity
+    annotation_data = {
+        "name": st.session_state.new_annotation_name,
+        "description": st.session_state.new_annotation_description,
+        "itemName": st.session_state.new_annotation_item_name or None,
+        "price": price if price is not None and price > 0 else None,
+        "quantity": quantity if quantity is not None and quantity > 0 else None
+    }
+    submit_annotation(
+        session,
+        st.session_state.user_id,
+        annotation_data,
+        st.session_state.submission_jobs,
+        optimistic=True
+    )
+
+JOB_STATUS_ICONS = {
+    SubmissionJob.PENDING: "⏳",
+    SubmissionJob.RUNNING: "⚙️",
+    SubmissionJob.DONE: "✅",
+    SubmissionJob.FAILED: "❌",
+}
+
+def render_submission_jobs():
+    """Status of this session's background submissions; polls while any is in flight"""
+    jobs = st.session_state.get('submission_jobs', [])
+    if not jobs:
+        return
+    if all(job.finished for job in jobs):
+        render_job_list(jobs)
+    else:
+        poll_submission_jobs()
+
+@st.fragment(run_every=SUBMISSION_POLL_INTERVAL)
+def poll_submission_jobs():
+    jobs = st.session_state.submission_jobs
+    render_job_list(jobs)
+    if all(job.finished for job in jobs):
+        # Rerun the whole page so "Your Food Items" shows the new annotations
+        # (or puts back a failed delete); the annotations come from the cache
+        st.rerun()
+
+def render_job_list(jobs):
+    for job in jobs:
+        line = f"{JOB_STATUS_ICONS[job.status]} {job.description}"
+        if job.error:
+            line += f" — {job.error}"
+        st.write(line)
+    if any(job.finished for job in jobs):
+        st.button("Clear finished", on_click=clear_finished_jobs)
+
+def clear_finished_jobs():
+    st.session_state.submission_jobs = [
+        job for job in st.session_state.submission_jobs if not job.finished
+    ]
+
+def render_metrics_panel():
+    """Sidebar timings and cache counters, shown with ?debug=1 in the URL"""
+    with st.sidebar.expander("Metrics", expanded=False):
+        rows = []
+        for (name, labels), histogram in sorted(REGISTRY.histograms().items()):
+            if histogram.count == 0 or not name.endswith('_seconds'):
+                continue
+            rows.append({
+                'metric': name.removeprefix('foodmeter_').removesuffix('_seconds'),
+                'labels': ', '.join(f"{key}={value}" for key, value in labels),
+                'count': histogram.count,
+                'p50 (ms)': histogram.quantile(0.5) * 1000,
+                'p95 (ms)': histogram.quantile(0.95) * 1000,
+                'mean (ms)': histogram.sum / histogram.count * 1000,
+            })
+        if rows:
+            st.dataframe(pd.DataFrame(rows), hide_index=True)
+        caches = [
+            {'cache': labels['cache'], 'metric': name.removeprefix('foodmeter_cache_'), 'value': value}
+            for name, labels, value in REGISTRY.samples() if 'cache' in labels
+        ]
+        if caches:
+            st.dataframe(
+                pd.DataFrame(caches).pivot(index='cache', columns='metric', values='value'),
+            )
+        st.download_button(
+            "Download Prometheus metrics",
+            REGISTRY.render_prometheus(),
+            file_name="foodmeter.prom",
+            mime="text/plain"
+        )
+
 def main(session):
     if st.session_state and st.session_state.logged_in:
         st.markdown(f"""
@@ -97,7 +271,8 @@ def main(session):
         username = st.text_input("Enter email")
         
         if st.button("Login"):
-            user = get_user_by_username(session, username)
+            with stage("login"):
+                user = get_user_by_username(session, username)
             if user:
                 st.session_state.logged_in = True
                 st.session_state.user_id = user['id']
@@ -128,6 +303,9 @@ def main(session):
             # Initialize session state for selected option
             if "reset_counter" not in st.session_state:
                 st.session_state.reset_counter = 0
+            # Background quick-add submissions of this browser session
+            if "submission_jobs" not in st.session_state:
+                st.session_state.submission_jobs = []
 
             # Create new annotation section
             st.header("Add New Food Items (A.I. way)", divider=True)
@@ -167,15 +345,18 @@ def main(session):
                         # Record audio
                         recording, sample_rate = record_audio()
                         
-                        # Save audio to temporary file
-                        audio_file_path = save_audio(recording, sample_rate)
+                        # Crop to speech, downsample and encode in memory; nothing is written to disk
+                        audio_file = prepare_audio(recording, sample_rate)
                         
-                        # Transcribe audio
-                        st.session_state.reset_counter += 1
-                        st.session_state.transcribed_text = transcribe_audio(audio_file_path, api_key)
-                        quick_description = st.session_state.transcribed_text
-                        increment_user_ops(session);
-                        st.rerun()
+                        if audio_file is None:
+                            st.warning("No speech detected, please try again.")
+                        else:
+                            # Transcribe audio
+                            st.session_state.reset_counter += 1
+                            st.session_state.transcribed_text = transcribe_audio(audio_file, api_key)
+                            quick_description = st.session_state.transcribed_text
+                            increment_user_ops(session, st.session_state.user_id)
+                            st.rerun()
                         
                     except Exception as e:
                         st.error(f"An error occurred: {str(e)}")
@@ -199,94 +380,94 @@ def main(session):
                         "price": None,
                         "quantity": None
                     }
-                    if create_waste_annotation(session, st.session_state.user_id, annotation_data):
-                        st.success("Foof added successfully!")
-                        st.rerun()
+                    # Posted in the background so more items can be added meanwhile
+                    submit_annotation(
+                        session,
+                        st.session_state.user_id,
+                        annotation_data,
+                        st.session_state.submission_jobs
+                    )
+
+            # Several descriptions at once, e.g. a pasted receipt
+            with st.form("batch_new_annotations", clear_on_submit=True):
+                batch_text = st.text_area(
+                    "Add many food items at once: one description per line, or paste a receipt",
+                    placeholder="2 kg of peaches at 5 USD per kilo\nOne box of biscuits, 5 USD"
+                )
+                batch_button = st.form_submit_button("Quick Add All")
+
+                if batch_button:
+                    descriptions = split_batch_text(batch_text)
+                    if descriptions:
+                        submit_annotation_batch(
+                            session,
+                            st.session_state.user_id,
+                            [
+                                {
+                                    "name": st.session_state.username,
+                                    "description": description,
+                                    "itemName": None,
+                                    "price": None,
+                                    "quantity": None
+                                }
+                                for description in descriptions
+                            ],
+                            st.session_state.submission_jobs
+                        )
                     else:
-                        st.error("Failed to add food")
+                        st.warning("Enter at least one food description")
+
+            render_submission_jobs()
 
             st.header("Add New Food Items (old way)", divider=True)
             with st.form("new_annotation"):
-                name = st.text_input("Name")
-                description = st.text_area("Description")
-                item_name = st.text_input("Item Name")
-                price = st.number_input("Price", min_value=0.0, value=None)
-                quantity = st.number_input("Quantity", min_value=0, value=None)
-                
-                submit_button = st.form_submit_button("Add Food Item")
+                st.text_input("Name", key="new_annotation_name")
+                st.text_area("Description", key="new_annotation_description")
+                st.text_input("Item Name", key="new_annotation_item_name")
+                st.number_input("Price", min_value=0.0, value=None, key="new_annotation_price")
+                st.number_input("Quantity", min_value=0, value=None, key="new_annotation_quantity")
                 
-                if submit_button:
-                    if price is None or price <= 0:
-                        price = None
-                    if quantity is None or quantity <= 0:
-                        quantity = None
-                    annotation_data = {
-                        "name": name,
-                        "description": description,
-                        "itemName": item_name if item_name else None,
-                        "price": price,
-                        "quantity": quantity
-                    }
-
-                    # Placeholder for the progress message
-                    progress_message = st.empty()
-                    progress_message.write("Processing request...")
-
-                    if create_waste_annotation(session, st.session_state.user_id, annotation_data):
-                        st.success("Foof added successfully!")
-                        st.rerun()
-                    else:
-                        st.error("Failed to add food")
+                # Listed below at once; its status shows with the other submissions above
+                st.form_submit_button("Add Food Item", on_click=add_food_item, args=(session,))
 
             # Display existing annotations
             st.header("Your Food Items", divider=True)
-            annotations = get_waste_annotations(session, st.session_state.user_id)
+            with stage("annotation fetch"):
+                annotations = get_waste_annotations(session, st.session_state.user_id)
             
             if not annotations:
                 st.info("No food items found")
             else:
-                for annotation in annotations:
-                    with st.expander(f"Food Items: {annotation.get('name', 'N/A')}"):
-                        st.write(f"Description: {annotation.get('description', 'N/A')}")
-                        if annotation.get('itemName'):
-                            st.write(f"Item Name: {annotation['itemName']}")
-                        if annotation.get('price'):
-                            st.write(f"Price: {annotation['price']}")
-                        if annotation.get('quantity'):
-                            st.write(f"Quantity: {annotation['quantity']}")
-                        if annotation.get('timestamp'):
-                            st.write(f"Timestamp: {annotation['timestamp']}")
-                        
-                        if st.button("Delete", key=f"delete_{annotation['id']}"):
-                            if delete_waste_annotation(
-                                session, 
-                                st.session_state.user_id,
-                                annotation['id']
-                            ):
-                                st.success("Item deleted successfully!")
-                                st.rerun()
-                            else:
-                                st.error("Failed to delete item")
+                with stage("table render"):
+                    render_food_items(session, annotations)
 
         elif page == "Price History":
             st.header("Price History Analysis", divider=True)
             
-            # Get annotations and prepare data
-            annotations = get_waste_annotations(session, st.session_state.user_id)
-            df = get_price_history_data( annotations)
+            # Get annotations and prepare data (cached until the annotations change)
+            with stage("annotation fetch"):
+                annotation_set = get_waste_annotation_set(session, st.session_state.user_id)
+            with stage("dataframe build"):
+                frames = get_price_history_frames(
+                    st.session_state.user_id,
+                    annotation_set.version,
+                    annotation_set.batch
+                )
             
-            if df is not None and not df.empty:
+            if frames is not None:
+                df = frames['df']
+                items = frames['items']
+
                 # Create tabs for different views
                 tab1, tab2 = st.tabs(["Item Price History", "Cumulative Analysis"])
                 
                 with tab1:
                     st.header("Price History by Item")
                     # Create item selector
-                    items = sorted(df['itemName'].unique())
                     selected_item = st.selectbox("Select Item", items)
                     
-                    # Filter data for selected item
-                    item_data = df[df['itemName'] == selected_item].sort_values('timestamp')
+                    # Rows for the selected item, from the per-item index
+                    item_data = get_item_history(frames, selected_item)
                     
                     # Create the price history plot
                     fig_price = px.line(
@@ -324,56 +505,22 @@ def main(session):
                 with tab2:
                     st.header("Cumulative Spending Analysis")
                     
-                    # Overall cumulative sum chart
-                    fig_cumsum = go.Figure()
-                    
-                    # Add overall cumulative sum line
-                    fig_cumsum.add_trace(go.Scatter(
-                        x=df['timestamp'],
-                        y=df['overall_cumulative_sum'],
-                        mode='lines',
-                        name='Total Cumulative Spending',
-                        line=dict(width=3, color='black')
-                    ))
-                    
-                    # Add individual item cumulative sums
-                    for item in items:
-                        item_data = df[df['itemName'] == item]
-                        fig_cumsum.add_trace(go.Scatter(
-                            x=item_data['timestamp'],
-                            y=item_data['cumulative_sum'],
-                            mode='lines+markers',
-                            name=f'{item} Cumulative',
-                            marker=dict(size=8)
-                        ))
-                    
-                    fig_cumsum.update_layout(
-                        title='Cumulative Spending Over Time',
-                        xaxis_title='Date',
-                        yaxis_title='Cumulative Spending',
-                        hovermode='x unified',
-                        showlegend=True
-                    )
+                    aggregate = st.selectbox("Aggregate by", list(AGGREGATIONS))
+                    with stage("chart build"):
+                        fig_cumsum = get_cumulative_figure(
+                            st.session_state.user_id,
+                            annotation_set.version,
+                            aggregate,
+                            CHART_POINT_BUDGET,
+                            frames
+                        )
                     
                     st.plotly_chart(fig_cumsum)
                     
                     # Summary statistics
                     st.header("Spending Summary")
-                    total_spent = df['total_spent'].sum()
-                    
-                    # Create summary by item
-                    summary_by_item = df.groupby('itemName').agg({
-                        'total_spent': 'sum',
-                        'quantity': 'sum'
-                    }).round(2)
-                    
-                    summary_by_item.columns = ['Total Spent', 'Total Quantity']
-                    summary_by_item['Percentage of Total'] = (
-                        summary_by_item['Total Spent'] / total_spent * 100
-                    ).round(2)
-                    
-                    st.write(f"Total spending: ${total_spent:,.2f}")
-                    st.dataframe(summary_by_item)
+                    st.write(f"Total spending: ${frames['total_spent']:,.2f}")
+                    st.dataframe(frames['summary_by_item'])
                     
             else:
                 st.info("No price history data available. Add annotations with prices to see the charts.")
@@ -422,7 +569,7 @@ def main(session):
                             # Create a DataFrame for easy display
                             if search_results.get("wasteAnnotations") is not None:
                                 annotations_result = search_results['wasteAnnotations']
-                                if annotations_result:
+                                if len(annotations_result):
                                     results_df = pd.DataFrame(annotations_result)
                                     st.dataframe(results_df)
                                     
@@ -514,12 +661,16 @@ def main(session):
                         st.error("Failed to perform search. Please try again.")
 
 if verify_access_token():
-    # Create a session that skips certificate verification
+    # Shared pooled session, reused across reruns and browser sessions
     session = create_session()
     logging.disable(logging.DEBUG)
 
     if __name__ == "__main__":
         main(session)
+        if st.query_params.get("debug") == "1":
+            render_metrics_panel()
+        if METRICS_TEXTFILE:
+            REGISTRY.write_textfile(METRICS_TEXTFILE)
 else:
     if __name__ == "__main__":
         st.error("Unauthorized access. Please use a valid access link.")
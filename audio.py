@@ -1,37 +1,215 @@
+import hashlib
+import io
+import os
+import threading
+from math import gcd
 import streamlit as st
 import sounddevice as sd
 import numpy as np
 import scipy.io.wavfile as wav
+from scipy.signal import resample_poly
 import openai
-from tempfile import NamedTemporaryFile
-
-def record_audio(duration=5, sample_rate=44100):
-    """Record audio from microphone"""
-    recording = sd.rec(int(duration * sample_rate),
-                      samplerate=sample_rate,
-                      channels=1,
-                      dtype=np.int16)
-    st.info("Recording...")
-    sd.wait()
+from dotenv import load_dotenv
+from cache import TTLCache
+from metrics import REGISTRY, SIZE_BUCKETS, cache_samples, timed
+
+try:
+    # Optional: only needed for the compressed upload formats
+    import soundfile
+except (ImportError, OSError):
+    soundfile = None
+
+SAMPLE_RATE = 44100
+# Length of each block handed to the stream callback, in seconds
+BLOCK_DURATION = 0.05
+# Longest utterance kept, and how long to wait for speech to start, in seconds
+MAX_DURATION = float(os.getenv('audio_max_duration', 15))
+SPEECH_TIMEOUT = float(os.getenv('audio_speech_timeout', 5))
+# Trailing silence (seconds) that ends the recording once speech was heard
+SILENCE_DURATION = float(os.getenv('audio_silence_duration', 1.0))
+# Block RMS (int16 scale) above which a block counts as speech
+SILENCE_THRESHOLD = float(os.getenv('audio_silence_threshold', 500))
+# Audio kept from just before speech started, in seconds
+PRE_ROLL = 0.3
+# Voice activity detection run on every recording before it is uploaded:
+# a 20 ms frame is voiced when its RMS (int16 scale) reaches the energy
+# threshold and its zero-crossing rate (crossings per sample) stays below the
+# ZCR ceiling, which rejects hiss, fans and clicks that are loud but noise-like.
+VAD_FRAME_DURATION = 0.02
+VAD_ENERGY_THRESHOLD = float(os.getenv('vad_energy_threshold', SILENCE_THRESHOLD))
+VAD_ZCR_MAX = float(os.getenv('vad_zcr_max', 0.35))
+# Less voiced audio than this (seconds) and the clip is treated as empty
+VAD_MIN_SPEECH = float(os.getenv('vad_min_speech', 0.2))
+# Audio kept on either side of the voiced region, in seconds
+VAD_PADDING = float(os.getenv('vad_padding', 0.15))
+# Whisper works at 16 kHz; anything above that is wasted upload
+TRANSCRIPTION_SAMPLE_RATE = 16000
+# Upload format: 'wav', or 'flac' / 'ogg' when the soundfile package is installed
+AUDIO_UPLOAD_FORMAT = os.getenv('audio_upload_format', 'flac')
+
+load_dotenv()
+# Alternative OpenAI-compatible endpoint, e.g. the stub in benchmarks/stub_api.py
+OPENAI_BASE_URL = os.getenv('openai_base_url')
+# Transcripts remembered per process, keyed by a hash of the uploaded audio
+TRANSCRIPT_CACHE_SIZE = int(os.getenv('transcript_cache_size', 256))
+
+class UtteranceRecorder:
+    """Collects microphone blocks in a ring buffer until the speaker goes quiet.
+
+    callback() runs on the PortAudio thread; done is set once speech was
+    followed by silence_duration of silence, when max_duration of speech has
+    been captured, or when no speech started within speech_timeout.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, max_duration=MAX_DURATION,
+                 speech_timeout=SPEECH_TIMEOUT, silence_duration=SILENCE_DURATION,
+                 silence_threshold=SILENCE_THRESHOLD):
+        self.sample_rate = sample_rate
+        self.silence_threshold = silence_threshold
+        self.capacity = int(max_duration * sample_rate)
+        self.speech_timeout = int(speech_timeout * sample_rate)
+        self.silence_limit = int(silence_duration * sample_rate)
+        self.done = threading.Event()
+        self._buffer = np.zeros(self.capacity, dtype=np.int16)
+        self._written = 0  # samples written since the start, not wrapped
+        self._speech_start = None
+        self._last_speech = None
+
+    def callback(self, indata, frames, time_info, status):
+        if self.done.is_set():
+            return
+        block = indata[:, 0]
+        self._write(block)
+        end = self._written
+        if np.sqrt(np.mean(block.astype(np.float32) ** 2)) >= self.silence_threshold:
+            if self._speech_start is None:
+                self._speech_start = end - len(block)
+            self._last_speech = end
+        if self._speech_start is None:
+            if end >= self.speech_timeout:
+                self.done.set()
+        elif (end - self._last_speech >= self.silence_limit
+              or end - self._speech_start >= self.capacity):
+            self.done.set()
+
+    def _write(self, block):
+        start = self._written % self.capacity
+        first = min(len(block), self.capacity - start)
+        self._buffer[start:start + first] = block[:first]
+        self._buffer[:len(block) - first] = block[first:]
+        self._written += len(block)
+
+    def recording(self):
+        """The utterance (with a little pre-roll), or everything kept if nobody spoke"""
+        oldest = max(0, self._written - self.capacity)
+        start = oldest
+        if self._speech_start is not None:
+            start = max(oldest, self._speech_start - int(PRE_ROLL * self.sample_rate))
+        positions = np.arange(start, self._written) % self.capacity
+        return self._buffer[positions]
+
+def record_audio(sample_rate=SAMPLE_RATE):
+    """Record from the microphone until the speaker stops talking"""
+    recorder = UtteranceRecorder(sample_rate)
+    st.info("Recording... speak now")
+    with sd.InputStream(samplerate=sample_rate,
+                        channels=1,
+                        dtype=np.int16,
+                        blocksize=int(BLOCK_DURATION * sample_rate),
+                        callback=recorder.callback):
+        recorder.done.wait(timeout=SPEECH_TIMEOUT + MAX_DURATION + SILENCE_DURATION)
     st.success("Recording complete!")
-    return recording, sample_rate
-
-def save_audio(recording, sample_rate):
-    """Save the recording to a temporary WAV file"""
-    with NamedTemporaryFile(delete=False, suffix='.wav') as temp_audio:
-        wav.write(temp_audio.name, sample_rate, recording)
-        return temp_audio.name
-
-def transcribe_audio(audio_file_path, api_key):
-    """Transcribe audio using OpenAI's API with forced English language"""
-    client = openai.OpenAI(api_key=api_key)
-    
-    with open(audio_file_path, 'rb') as audio_file:
-        transcript = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_file,
-            language="en",
-            prompt="Please transcribe this audio in English only."
-        )
-    return transcript.text
+    return recorder.recording(), sample_rate
+
+def voiced_frames(recording, sample_rate, energy_threshold=VAD_ENERGY_THRESHOLD,
+                  zcr_max=VAD_ZCR_MAX, frame_duration=VAD_FRAME_DURATION):
+    """Boolean mask of voiced frames, from per-frame RMS energy and zero-crossing rate"""
+    frame = max(1, int(frame_duration * sample_rate))
+    usable = len(recording) // frame * frame
+    frames = recording[:usable].astype(np.float32).reshape(-1, frame)
+    energy = np.sqrt(np.mean(frames ** 2, axis=1))
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frame
+    return (energy >= energy_threshold) & (zcr <= zcr_max)
 
+def detect_speech(recording, sample_rate, min_speech=VAD_MIN_SPEECH, padding=VAD_PADDING, **thresholds):
+    """(start, end) sample range of the voiced part of a recording, or None if silent"""
+    frame = max(1, int(VAD_FRAME_DURATION * sample_rate))
+    voiced = np.flatnonzero(voiced_frames(recording, sample_rate, **thresholds))
+    if voiced.size * frame < min_speech * sample_rate:
+        return None
+    pad = int(padding * sample_rate)
+    start = max(0, int(voiced[0]) * frame - pad)
+    end = min(len(recording), (int(voiced[-1]) + 1) * frame + pad)
+    return start, end
+
+def resample(recording, sample_rate, target_rate=TRANSCRIPTION_SAMPLE_RATE):
+    """Polyphase resample of int16 audio to target_rate"""
+    if sample_rate == target_rate or len(recording) == 0:
+        return recording
+    divisor = gcd(sample_rate, target_rate)
+    resampled = resample_poly(recording.astype(np.float32), target_rate // divisor, sample_rate // divisor)
+    return np.clip(np.round(resampled), -32768, 32767).astype(np.int16)
+
+def encode_wav(recording, sample_rate):
+    """Encode the recording as WAV bytes in memory"""
+    buffer = io.BytesIO()
+    wav.write(buffer, sample_rate, recording)
+    return buffer.getvalue()
+
+def encode_audio(recording, sample_rate, audio_format=AUDIO_UPLOAD_FORMAT):
+    """Encode in memory as (filename, bytes); falls back to WAV without soundfile"""
+    if audio_format in ('flac', 'ogg') and soundfile is not None:
+        buffer = io.BytesIO()
+        soundfile.write(buffer, recording, sample_rate, format=audio_format.upper())
+        return f"recording.{audio_format}", buffer.getvalue()
+    return "recording.wav", encode_wav(recording, sample_rate)
+
+def prepare_audio(recording, sample_rate, audio_format=AUDIO_UPLOAD_FORMAT):
+    """Crop to the speech, downsample to 16 kHz and encode a recording for upload.
+
+    Returns None when voice activity detection finds no speech, so nothing
+    needs to be sent for transcription.
+    """
+    recording = recording.reshape(-1)
+    speech = detect_speech(recording, sample_rate)
+    if speech is None:
+        return None
+    recording = resample(recording[speech[0]:speech[1]], sample_rate)
+    return encode_audio(recording, TRANSCRIPTION_SAMPLE_RATE, audio_format)
+
+@st.cache_resource
+def get_openai_client(api_key):
+    """One OpenAI client per process, so its HTTP connections are reused across clicks"""
+    return openai.OpenAI(api_key=api_key, base_url=OPENAI_BASE_URL)
+
+@st.cache_resource
+def get_transcript_cache():
+    """sha256 of uploaded audio -> transcript, shared by every Streamlit session"""
+    return TTLCache(maxsize=TRANSCRIPT_CACHE_SIZE)
+
+REGISTRY.add_collector(lambda: cache_samples('transcripts', get_transcript_cache().stats()))
+
+@timed('foodmeter_api_call_seconds', function='transcribe_audio')
+def transcribe_audio(audio_file, api_key):
+    """Transcribe audio using OpenAI's API with forced English language
+
+    audio_file is a (filename, bytes) pair such as prepare_audio returns.
+    Audio that was transcribed before is answered from the transcript cache.
+    """
+    filename, data = audio_file
+    REGISTRY.observe('foodmeter_audio_upload_bytes', len(data), buckets=SIZE_BUCKETS)
+    key = hashlib.sha256(data).hexdigest()
+    cache = get_transcript_cache()
+    text = cache.get(key)
+    if text is not None:
+        return text
+
+    transcript = get_openai_client(api_key).audio.transcriptions.create(
+        model="whisper-1",
+        file=audio_file,
+        language="en",
+        prompt="Please transcribe this audio in English only."
+    )
+    cache.set(key, transcript.text)
+    return transcript.text
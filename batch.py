@@ -0,0 +1,280 @@
+from datetime import timezone
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from dateutil import parser
+
+# Fields of an annotation as the API sends them; anything else is dropped
+FIELDS = ['id', 'name', 'description', 'itemName', 'price', 'quantity', 'timestamp']
+
+# Layout of AnnotationBatch.to_arrow(), also what the on-disk store holds
+ARROW_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('name', pa.dictionary(pa.int32(), pa.string())),
+    ('description', pa.string()),
+    ('itemName', pa.dictionary(pa.int32(), pa.string())),
+    ('price', pa.float64()),
+    ('quantity', pa.float64()),
+    ('timestamp', pa.timestamp('ns')),
+])
+
+
+def parse_timestamp(timestamp_str):
+    """Parse timestamp string to datetime object using dateutil parser"""
+    try:
+        return parser.parse(timestamp_str)
+    except (ValueError, TypeError):
+        return None
+
+# UTC offset at the end of an ISO-8601 string: Z, +01:00 or +0100
+_UTC_OFFSET = r'(?:[zZ]|[+-]\d\d:?\d\d)$'
+
+def _to_datetime(values):
+    """pd.to_datetime into UTC; strings without an offset are taken as UTC.
+
+    Always utc=True: mixed offsets (a history spanning a DST change) otherwise
+    come back as an object Series rather than raising. pandas reads a string
+    without an offset with the offset of the string before it, so when both
+    kinds are present each is parsed on its own.
+    """
+    try:
+        has_offset = pc.fill_null(
+            pc.match_substring_regex(pa.array(values, type=pa.string(), from_pandas=True), _UTC_OFFSET), False
+        ).to_numpy(zero_copy_only=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        has_offset = None
+    if has_offset is None or has_offset.all() or not has_offset.any():
+        return pd.to_datetime(values, format='ISO8601', errors='coerce', utc=True)
+    return pd.concat([
+        pd.to_datetime(values[has_offset], format='ISO8601', errors='coerce', utc=True),
+        pd.to_datetime(values[~has_offset], format='ISO8601', errors='coerce', utc=True),
+    ]).reindex(values.index)
+
+def _utc_isoformat(dt):
+    # With an explicit offset: pandas would read a naive string with the offset of the row before it
+    if dt is None:
+        return None
+    return (dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).isoformat()
+
+def parse_timestamps(values):
+    """Vectorized ISO-8601 parse of a Series into UTC; dateutil only for the rows that fail.
+
+    Timestamps without an offset are taken as UTC.
+    """
+    parsed = _to_datetime(values)
+    failed = parsed.isna() & values.notna()
+    if failed.any():
+        # Rewrite the odd formats as ISO-8601 with dateutil, then parse again
+        rewritten = values[failed].map(parse_timestamp).map(_utc_isoformat)
+        parsed = _to_datetime(values.mask(failed, rewritten))
+    return parsed
+
+
+class AnnotationBatch:
+    """A user's annotations as typed columns instead of one dict per annotation.
+
+    Item and user names are categoricals (small integer codes plus one copy of
+    each distinct string), descriptions one Arrow string buffer, prices and
+    quantities float64 with NaN when missing, and timestamps int64 nanoseconds
+    (datetime64[ns], naive; offsets are converted to UTC) with NaT when missing.
+    Batches are never modified in place: slicing, take and concat return new
+    ones, mostly as views, so a batch can be shared between sessions.
+    """
+
+    def __init__(self, ids, names, descriptions, item_names, prices, quantities, timestamps):
+        self.ids = ids
+        self.names = names
+        self.descriptions = descriptions
+        self.item_names = item_names
+        self.prices = prices
+        self.quantities = quantities
+        self.timestamps = timestamps
+
+    @classmethod
+    def from_records(cls, records):
+        """Build a batch from the API's list of annotations, as dicts or decode.Annotation structs"""
+        if records and not isinstance(records[0], dict):
+            columns = {field: [getattr(r, field) for r in records] for field in FIELDS}
+        else:
+            columns = {field: [r.get(field) for r in records] for field in FIELDS}
+        try:
+            ids = np.array(columns['id'], dtype=np.int64)
+        except (TypeError, ValueError, OverflowError):
+            # Not integer ids (or some missing): keep them as they came
+            ids = np.array(columns['id'], dtype=object)
+        timestamps = parse_timestamps(pd.Series(columns['timestamp'], dtype=object)).dt.tz_convert(None)
+        return cls(
+            ids,
+            _categorical(columns['name']),
+            _string_array(columns['description']),
+            _categorical(columns['itemName']),
+            _float_array(columns['price']),
+            _float_array(columns['quantity']),
+            timestamps.to_numpy(dtype='datetime64[ns]'),
+        )
+
+    @classmethod
+    def from_arrow(cls, table):
+        """Inverse of to_arrow; numeric columns are read without copying where possible"""
+        return cls(
+            table.column('id').to_numpy(),
+            pd.Categorical(table.column('name').to_pandas()),
+            table.column('description').combine_chunks(),
+            pd.Categorical(table.column('itemName').to_pandas()),
+            table.column('price').to_numpy(),
+            table.column('quantity').to_numpy(),
+            table.column('timestamp').to_numpy(),
+        )
+
+    @classmethod
+    def concat(cls, batches):
+        batches = [batch for batch in batches if len(batch)] or batches[:1]
+        if len(batches) == 1:
+            return batches[0]
+        return cls(
+            np.concatenate([b.ids for b in batches]),
+            pd.api.types.union_categoricals([b.names for b in batches], sort_categories=True),
+            pa.concat_arrays([b.descriptions for b in batches]),
+            pd.api.types.union_categoricals([b.item_names for b in batches], sort_categories=True),
+            np.concatenate([b.prices for b in batches]),
+            np.concatenate([b.quantities for b in batches]),
+            np.concatenate([b.timestamps for b in batches]),
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, rows):
+        """A slice is a view; anything else goes through take"""
+        if not isinstance(rows, slice):
+            return self.take(rows)
+        start, stop, step = rows.indices(len(self))
+        if step != 1:
+            return self.take(np.arange(start, stop, step))
+        return AnnotationBatch(
+            self.ids[start:stop],
+            self.names[start:stop],
+            self.descriptions.slice(start, max(stop - start, 0)),
+            self.item_names[start:stop],
+            self.prices[start:stop],
+            self.quantities[start:stop],
+            self.timestamps[start:stop],
+        )
+
+    def take(self, rows):
+        """Rows at the given positions (or boolean mask), in that order"""
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        return AnnotationBatch(
+            self.ids[rows],
+            self.names.take(rows),
+            self.descriptions.take(pa.array(rows, type=pa.int64())),
+            self.item_names.take(rows),
+            self.prices[rows],
+            self.quantities[rows],
+            self.timestamps[rows],
+        )
+
+    def column(self, field):
+        """One field as a pandas-friendly array (Categorical, ndarray or Arrow-backed strings)"""
+        if field == 'description':
+            return pd.array(self.descriptions, dtype=pd.ArrowDtype(pa.string()))
+        values = getattr(self, _ATTRIBUTES[field])
+        if isinstance(values, pd.Categorical):
+            # Items outside this batch would show up as zero counts in value_counts()
+            values = values.remove_unused_categories()
+        return values
+
+    def equals(self, other):
+        """Same annotations in the same order; missing values compare equal"""
+        return (
+            len(self) == len(other)
+            and np.array_equal(self.ids, other.ids)
+            # column() drops unused categories, which a merged batch may still carry
+            and self.column('name').equals(other.column('name'))
+            and self.descriptions.equals(other.descriptions)
+            and self.column('itemName').equals(other.column('itemName'))
+            and np.array_equal(self.prices, other.prices, equal_nan=True)
+            and np.array_equal(self.quantities, other.quantities, equal_nan=True)
+            and np.array_equal(self.timestamps, other.timestamps, equal_nan=True)
+        )
+
+    def to_frame(self, columns=FIELDS):
+        """A DataFrame of the given fields; categoricals and numbers are not copied to objects"""
+        return pd.DataFrame({field: self.column(field) for field in columns})
+
+    def to_arrow(self):
+        return pa.table([
+            pa.array(self.ids, type=pa.int64()),
+            _dictionary_array(self.names),
+            self.descriptions,
+            _dictionary_array(self.item_names),
+            pa.array(self.prices, type=pa.float64()),
+            pa.array(self.quantities, type=pa.float64()),
+            pa.array(self.timestamps, type=pa.timestamp('ns')),
+        ], schema=ARROW_SCHEMA)
+
+    def to_records(self):
+        """Plain dicts shaped like the API's, for the few rows a page shows"""
+        ids = self.ids.tolist()
+        names = self.names.tolist()
+        descriptions = self.descriptions.to_pylist()
+        item_names = self.item_names.tolist()
+        return [
+            {
+                'id': ids[i],
+                'name': _none_if_nan(names[i]),
+                'description': descriptions[i],
+                'itemName': _none_if_nan(item_names[i]),
+                'price': _none_if_nan(self.prices[i].item()),
+                'quantity': _none_if_nan(self.quantities[i].item()),
+                'timestamp': None if np.isnat(self.timestamps[i]) else pd.Timestamp(self.timestamps[i]),
+            }
+            for i in range(len(self))
+        ]
+
+    @property
+    def nbytes(self):
+        """Memory held by the columns (descriptions and category strings by their UTF-8 size)"""
+        categories = sum(
+            cat.codes.nbytes + sum(len(str(category).encode()) for category in cat.categories)
+            for cat in (self.names, self.item_names)
+        )
+        ids = self.ids.nbytes if self.ids.dtype != object else 8 * len(self.ids)
+        return (ids + categories + self.descriptions.nbytes + self.prices.nbytes
+                + self.quantities.nbytes + self.timestamps.nbytes)
+
+_ATTRIBUTES = {
+    'id': 'ids', 'name': 'names', 'itemName': 'item_names', 'price': 'prices',
+    'quantity': 'quantities', 'timestamp': 'timestamps',
+}
+
+def _string_array(values):
+    try:
+        return pa.array(values, type=pa.string())
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+def _categorical(values):
+    """Categorical with sorted categories, dictionary-encoded by Arrow (faster than pandas on lists)"""
+    categorical = pd.Categorical(_string_array(values).dictionary_encode().to_pandas())
+    return categorical.set_categories(sorted(categorical.categories))
+
+def _float_array(values):
+    """float64 with NaN for missing or unparseable values"""
+    try:
+        # None becomes NaN; numeric strings are converted too
+        return np.array(values, dtype=float)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=float)
+
+def _dictionary_array(categorical):
+    return pa.DictionaryArray.from_arrays(
+        pa.array(categorical.codes.astype(np.int32), mask=categorical.codes < 0),
+        pa.array(categorical.categories.astype(str), type=pa.string()),
+    )
+
+def _none_if_nan(value):
+    return None if isinstance(value, float) and np.isnan(value) else value
@@ -0,0 +1,89 @@
+"""Transcription upload: raw 44.1 kHz WAV vs trimmed 16 kHz WAV/FLAC/OGG.
+
+Uploads go to the stub API's OpenAI-compatible transcription endpoint,
+throttled to --bandwidth bytes/s. Clips come from --corpus (a directory of
+mono WAV recordings) or are synthesised: a voiced tone burst between
+stretches of room noise.
+
+    python benchmarks/bench_audio.py --corpus recordings/ --bandwidth 250000
+"""
+import argparse
+import glob
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import scipy.io.wavfile as wav
+
+import audio
+from stub_api import create_app, serve
+
+
+def synthetic_clips(count=10, sample_rate=audio.SAMPLE_RATE, seed=0):
+    rng = np.random.default_rng(seed)
+    clips = []
+    for _ in range(count):
+        lead, speech, tail = rng.uniform(0.3, 1.0), rng.uniform(1.5, 4.0), rng.uniform(0.5, 1.5)
+        t = np.arange(int(speech * sample_rate)) / sample_rate
+        pitch = rng.uniform(100, 220)
+        voiced = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 6))
+        envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 3 * t) ** 2
+        noise = lambda seconds: rng.normal(0, 60, int(seconds * sample_rate))
+        clip = np.concatenate([noise(lead), 6000 * envelope * voiced + noise(speech), noise(tail)])
+        clips.append((np.clip(clip, -32768, 32767).astype(np.int16), sample_rate))
+    return clips
+
+
+def load_corpus(directory):
+    clips = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.wav'))):
+        sample_rate, data = wav.read(path)
+        if data.ndim > 1:
+            data = data[:, 0]
+        clips.append((data.astype(np.int16), sample_rate))
+    return clips
+
+
+def raw_upload(recording, sample_rate):
+    """What the mic button sent before: the untouched recording as WAV"""
+    return "recording.wav", audio.encode_wav(recording, sample_rate)
+
+
+def prepared_upload(audio_format):
+    return lambda recording, sample_rate: audio.prepare_audio(recording, sample_rate, audio_format)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', help='directory of WAV clips (default: synthetic clips)')
+    parser.add_argument('--bandwidth', type=float, default=250_000, help='uplink bytes/s')
+    args = parser.parse_args()
+    logging.disable(logging.DEBUG)
+
+    clips = load_corpus(args.corpus) if args.corpus else synthetic_clips()
+    pipelines = [('raw 44.1 kHz wav', raw_upload), ('16 kHz wav', prepared_upload('wav'))]
+    if audio.soundfile is not None:
+        pipelines += [('16 kHz flac', prepared_upload('flac')), ('16 kHz ogg', prepared_upload('ogg'))]
+
+    with serve(create_app(num_users=1, upload_bandwidth=args.bandwidth)) as base_url:
+        os.environ['OPENAI_BASE_URL'] = f"{base_url}/v1"
+        print(f"{len(clips)} clips, uplink {args.bandwidth / 1000:.0f} kB/s")
+        print(f"  {'pipeline':<18} {'mean bytes':>11} {'median ms':>10}")
+        for label, prepare in pipelines:
+            sizes, timings = [], []
+            for recording, sample_rate in clips:
+                start = time.perf_counter()
+                audio_file = prepare(recording, sample_rate)
+                audio.transcribe_audio(audio_file, 'stub-key')
+                timings.append(time.perf_counter() - start)
+                sizes.append(len(audio_file[1]))
+            print(f"  {label:<18} {statistics.mean(sizes):>11,.0f} {statistics.median(timings) * 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
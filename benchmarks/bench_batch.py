@@ -0,0 +1,64 @@
+"""Quick-add throughput for N descriptions: one at a time, pipelined, batched.
+
+The stub adds --ai-latency seconds to every create request, standing in for
+the backend's LLM parsing.
+
+    python benchmarks/bench_batch.py --sizes 1 5 20 --ai-latency 0.5
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+import api
+import jobs
+from stub_api import create_app, serve
+
+USER_ID = 1
+
+
+def sequential(session, annotations):
+    """What the Quick Add form did before: one blocking POST per description"""
+    for annotation in annotations:
+        api.post_waste_annotation(session, USER_ID, annotation)
+
+
+def queued(session, annotations):
+    submitted = []
+    jobs.submit_annotation_batch(session, USER_ID, annotations, submitted)
+    while not all(job.finished for job in submitted):
+        time.sleep(0.005)
+    assert all(job.status == jobs.SubmissionJob.DONE for job in submitted)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 5, 20])
+    parser.add_argument('--ai-latency', type=float, default=0.5)
+    args = parser.parse_args()
+    logging.disable(logging.DEBUG)
+
+    print(f"{'items':>6} {'mode':>11} {'seconds':>8} {'items/s':>8}")
+    for size in args.sizes:
+        annotations = [{'name': 'bench', 'description': f'Add {i} apples', 'itemName': None,
+                        'price': None, 'quantity': None} for i in range(size)]
+        for mode, batch, run in (('sequential', False, sequential),
+                                 ('pipelined', False, queued),
+                                 ('batched', True, queued)):
+            with serve(create_app(num_users=10, batch=batch, ai_latency=args.ai_latency)) as base_url:
+                api.BASE_URL = base_url
+                api._batch_endpoint_supported = None
+                session = requests.Session()
+                start = time.perf_counter()
+                run(session, annotations)
+                elapsed = time.perf_counter() - start
+            print(f"{size:>6} {mode:>11} {elapsed:>8.2f} {size / elapsed:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Cold start of the Price History page: full download vs the on-disk annotation store.
+
+Simulates a process restart by clearing every in-memory cache, then times
+loading the annotations and building the price history frames ('shown'), and
+until the background revalidation of a stored copy has finished ('fresh').
+Runs against a gateway with and without delta sync (?since= / If-None-Match).
+
+    python benchmarks/bench_cold_start.py --history 10000 100000 --latency 0.05
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+import api
+from stub_api import create_app, serve
+
+USER_ID = 1
+
+
+def cold_start(session):
+    api.get_annotation_cache.clear()
+    api.get_price_history_frames.clear()
+    start = time.perf_counter()
+    annotation_set = api.get_waste_annotation_set(session, USER_ID)
+    api.get_price_history_frames(USER_ID, annotation_set.version, annotation_set.batch)
+    shown = time.perf_counter() - start
+    for refresh in list(api._refreshes.values()):
+        refresh.result()
+    return shown, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--history', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--latency', type=float, default=0.05, help='gateway round trip, seconds')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.DEBUG)
+
+    print(f"{'history':>8} {'delta':>6} {'store':>6} {'shown ms':>9} {'fresh ms':>9}")
+    for history in args.history:
+        for delta in (True, False):
+            app = create_app(num_users=10, annotations_per_user=history, latency=args.latency, delta=delta)
+            with serve(app) as base_url, tempfile.TemporaryDirectory() as directory:
+                api.BASE_URL = base_url
+                session = requests.Session()
+                for store_dir in ('', directory):
+                    api.ANNOTATION_STORE_DIR = store_dir
+                    api.get_annotation_store.clear()
+                    if store_dir:
+                        cold_start(session)  # first run writes the store
+                    shown, fresh = zip(*(cold_start(session) for _ in range(args.repeat)))
+                    print(
+                        f"{history:>8,} {'on' if delta else 'off':>6} {'on' if store_dir else 'off':>6} "
+                        f"{statistics.median(shown) * 1000:>9.1f} {statistics.median(fresh) * 1000:>9.1f}"
+                    )
+
+
+if __name__ == '__main__':
+    main()
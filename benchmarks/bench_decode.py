@@ -0,0 +1,74 @@
+"""Full annotation download: JSON decoders and response compression.
+
+Fetches a user's whole history from the stub (gzip enabled) with each
+available decoder, with and without Accept-Encoding: gzip. Decode is the
+JSON parse, batch the AnnotationBatch build, fetch the whole GET round trip.
+Loopback makes transfer free, so the last column adds the time the bytes on
+the wire would take at --bandwidth Mbit/s.
+
+    python benchmarks/bench_decode.py --history 20000 100000 --bandwidth 50
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api
+import decode
+from batch import AnnotationBatch
+from stub_api import spawn
+
+USER_ID = 1
+ENCODINGS = {'identity': 'identity', 'gzip': 'gzip'}
+
+
+def available_decoders():
+    return [name for name, module in (('json', True), ('orjson', decode.orjson), ('msgspec', decode.msgspec)) if module]
+
+
+def median_time(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--history', type=int, nargs='+', default=[20_000, 100_000])
+    parser.add_argument('--bandwidth', type=float, default=50, help='Mbit/s for the transfer estimate')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.DEBUG)
+    api.ANNOTATION_STORE_DIR = ''
+
+    print(f"{'history':>8} {'raw MB':>7} {'encoding':>9} {'wire MB':>8} {'decoder':>8}"
+          f" {'decode ms':>10} {'batch ms':>9} {'fetch ms':>9} {'+wire ms':>9}")
+    for history in args.history:
+        with spawn(users=10, annotations=history, compress=True) as base_url:
+            api.BASE_URL = base_url
+            session = api.create_session()
+            for encoding, header in ENCODINGS.items():
+                session.headers['Accept-Encoding'] = header
+                response = session.get(f"{base_url}/users/{USER_ID}/wasteannotations", timeout=api.HTTP_TIMEOUT)
+                raw = len(response.content)
+                wire = int(response.headers.get('Content-Length', raw))
+                for decoder in available_decoders():
+                    decode.DECODER = decoder
+                    decode_time, payload = median_time(lambda: decode.decode_annotations(response.content), args.repeat)
+                    batch_time, _ = median_time(lambda: AnnotationBatch.from_records(payload), args.repeat)
+                    fetch_time, _ = median_time(lambda: api._sync_waste_annotations(session, USER_ID), args.repeat)
+                    transfer = wire * 8 / (args.bandwidth * 1e6)
+                    print(f"{history:>8,} {raw / 2 ** 20:>7.1f} {encoding:>9} {wire / 2 ** 20:>8.2f} {decoder:>8}"
+                          f" {decode_time * 1000:>10.0f} {batch_time * 1000:>9.0f} {fetch_time * 1000:>9.0f}"
+                          f" {(fetch_time + transfer) * 1000:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
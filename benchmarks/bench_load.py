@@ -0,0 +1,299 @@
+"""Load test of the api.py calls and of headless app reruns against the stub API.
+
+Every scenario runs --requests operations on --concurrency threads sharing the
+pooled session, and reports p50/p95/p99 latency, throughput and peak memory.
+The stub runs in a child process so its work is not counted. The app scenario
+drives app.py with Streamlit's AppTest: log in, then cycle through the pages.
+
+    python benchmarks/bench_load.py --users 10000 --history 20000 --latency 0.02
+    python benchmarks/bench_load.py --output baseline.json
+    python benchmarks/bench_load.py --baseline baseline.json   # exit 1 on regressions
+
+Peak memory is the process RSS high-water mark; --trace-memory adds the
+tracemalloc peak per scenario (slower, so latencies are not comparable).
+"""
+import argparse
+import concurrent.futures
+import itertools
+import json
+import logging
+import os
+import queue
+import random
+import resource
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import api
+from metrics import REGISTRY
+from stub_api import ITEMS, spawn
+
+ACCESS_TOKEN = 'bench'
+APP_PAGES = ["Food", "Price History", "Search Food"]
+
+
+def percentiles(timings):
+    if len(timings) < 2:
+        return {q: timings[0] if timings else None for q in ('p50', 'p95', 'p99')}
+    cuts = statistics.quantiles(timings, n=100, method='inclusive')
+    return {'p50': cuts[49], 'p95': cuts[94], 'p99': cuts[98]}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Scenario:
+    """A named operation, called as operation(i) for i in range(requests)"""
+
+    def __init__(self, name, operation, setup=None):
+        self.name = name
+        self.operation = operation
+        self.setup = setup
+
+    def run(self, requests, concurrency, trace_memory):
+        if self.setup:
+            self.setup()
+        timings = []
+        errors = 0
+        lock = threading.Lock()
+
+        def call(i):
+            nonlocal errors
+            start = time.perf_counter()
+            try:
+                self.operation(i)
+                failed = False
+            except Exception:
+                logging.exception(f"{self.name} #{i} failed")
+                failed = True
+            elapsed = time.perf_counter() - start
+            with lock:
+                timings.append(elapsed)
+                errors += failed
+
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(call, range(requests)))
+        wall = time.perf_counter() - start
+        result = {
+            'scenario': self.name,
+            'requests': requests,
+            'errors': errors,
+            'throughput': requests / wall,
+            **percentiles(timings),
+            'peak_rss_mb': peak_rss_mb(),
+        }
+        if trace_memory:
+            result['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+        return result
+
+
+def api_scenarios(session, users, active_users, seed):
+    """Scenarios for the api.py calls, spread over the first active_users users"""
+    rng = random.Random(seed)
+    user_ids = [1 + i % active_users for i in range(active_users)]
+
+    def user_for(i):
+        return user_ids[i % len(user_ids)]
+
+    def warm_caches():
+        for user_id in user_ids:
+            api.get_waste_annotation_set(session, user_id)
+
+    def login(i):
+        assert api.get_user_by_username(session, f"user{rng.randint(1, users)}@example.com")
+
+    def fetch_cold(i):
+        api.get_annotation_cache().pop(user_for(i))
+        api.get_waste_annotation_set(session, user_for(i))
+
+    def fetch_warm(i):
+        api.get_waste_annotation_set(session, user_for(i))
+
+    def price_history(i):
+        annotation_set = api.get_waste_annotation_set(session, user_for(i))
+        # A fresh version each call, so the frames are rebuilt rather than served from cache
+        api.get_price_history_frames(user_for(i), (annotation_set.version, i), annotation_set.batch)
+
+    def search_local(i):
+        api.search_waste_annotations(session, user_for(i), {
+            'itemName': ITEMS[i % len(ITEMS)],
+            'minPrice': i % 10,
+        })
+
+    def search_remote(i):
+        # Distinct free-text questions, so neither the result cache nor the local parser answers
+        api.search_waste_annotations(session, user_for(i), {
+            'query': f"Select the food with name {ITEMS[i % len(ITEMS)]} #{i}",
+        })
+
+    def add(i):
+        created, error = api.post_waste_annotation(session, user_for(i), {
+            'name': f"user{user_for(i)}@example.com",
+            'description': f"Add 1 {ITEMS[i % len(ITEMS)]} at 1.5 USD each",
+            'itemName': ITEMS[i % len(ITEMS)],
+            'price': 1.5,
+            'quantity': 1,
+        })
+        assert created, error
+
+    deletable = queue.Queue()
+
+    def collect_deletable():
+        warm_caches()
+        for user_id in user_ids:
+            for annotation_id in api.get_waste_annotation_set(session, user_id).batch.ids.tolist():
+                deletable.put((user_id, annotation_id))
+
+    def delete(i):
+        user_id, annotation_id = deletable.get_nowait()
+        deleted, error = api.remove_waste_annotation(session, user_id, annotation_id)
+        assert deleted, error
+
+    def increment_ops(i):
+        assert api.increment_user_ops(session, user_for(i))
+
+    return [
+        Scenario('login', login),
+        Scenario('fetch annotations (cold)', fetch_cold),
+        Scenario('fetch annotations (warm)', fetch_warm, warm_caches),
+        Scenario('price history frames', price_history, warm_caches),
+        Scenario('search (local)', search_local, warm_caches),
+        Scenario('search (remote)', search_remote),
+        Scenario('add annotation', add),
+        Scenario('delete annotation', delete, collect_deletable),
+        Scenario('increment ops', increment_ops),
+    ]
+
+
+def app_scenario():
+    """One headless browser session: every operation is a full rerun of app.py"""
+    from streamlit.testing.v1 import AppTest
+
+    # app.py opens its images relative to the working directory, like `streamlit run` from the repo
+    os.chdir(ROOT)
+    app = AppTest.from_file(os.path.join(ROOT, 'app.py'), default_timeout=120)
+    app.secrets['api_key'] = 'bench'
+    app.secrets['access_token'] = ACCESS_TOKEN
+    app.query_params['token'] = ACCESS_TOKEN
+    pages = itertools.cycle(APP_PAGES)
+
+    def login():
+        app.run()
+        app.text_input[0].input('user1@example.com')
+        app.button[0].click().run()
+        assert not app.exception, app.exception
+
+    def rerun(i):
+        app.sidebar.selectbox[0].select(next(pages)).run()
+        assert not app.exception, app.exception
+
+    return Scenario('app rerun', rerun, login)
+
+
+def stage_summary():
+    """Render stage timings recorded by app.py while the app scenario ran"""
+    rows = []
+    for (name, labels), histogram in sorted(REGISTRY.histograms().items()):
+        if name == 'foodmeter_render_stage_seconds' and histogram.count:
+            rows.append((dict(labels)['stage'], histogram.count,
+                         histogram.quantile(0.5), histogram.quantile(0.95)))
+    return rows
+
+
+def compare(results, baseline_path, tolerance):
+    """Scenarios whose p95 latency or throughput got worse than tolerance allows"""
+    with open(baseline_path) as f:
+        baseline = {result['scenario']: result for result in json.load(f)['results']}
+    regressions = []
+    for result in results:
+        before = baseline.get(result['scenario'])
+        if before is None:
+            continue
+        if result['p95'] > before['p95'] * (1 + tolerance):
+            regressions.append(f"{result['scenario']}: p95 {before['p95'] * 1000:.1f} -> {result['p95'] * 1000:.1f} ms")
+        if result['throughput'] < before['throughput'] / (1 + tolerance):
+            regressions.append(f"{result['scenario']}: throughput {before['throughput']:.1f} -> {result['throughput']:.1f}/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--history', type=int, default=5_000, help='annotations per user')
+    parser.add_argument('--active-users', type=int, default=20, help='users the load is spread over')
+    parser.add_argument('--latency', type=float, default=0.02, help='gateway round trip, seconds')
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--ai-latency', type=float, default=0.0, help='extra seconds on AI-backed endpoints')
+    parser.add_argument('--requests', type=int, default=200, help='operations per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--reruns', type=int, default=30, help='app reruns; 0 skips the app scenario')
+    parser.add_argument('--only', nargs='+', help='run only scenarios whose name starts with these')
+    parser.add_argument('--trace-memory', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results as JSON, for use as a --baseline')
+    parser.add_argument('--baseline', help='JSON from an earlier --output to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown')
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    # The app scenario changes the working directory
+    output, baseline = (os.path.abspath(path) if path else None for path in (args.output, args.baseline))
+
+    # Each run starts cold: no annotations from earlier runs on disk
+    api.ANNOTATION_STORE_DIR = ''
+    with spawn(users=args.users, annotations=args.history, latency=args.latency,
+               jitter=args.jitter, ai_latency=args.ai_latency, seed=args.seed) as base_url:
+        api.BASE_URL = base_url
+        session = api.create_session()
+        scenarios = api_scenarios(session, args.users, args.active_users, args.seed)
+        if args.reruns:
+            scenarios.append(app_scenario())
+        if args.only:
+            scenarios = [s for s in scenarios if s.name.startswith(tuple(args.only))]
+
+        results = []
+        print(f"{'scenario':<26} {'ops':>5} {'err':>4} {'ops/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'rss MB':>7}"
+              + (f" {'heap MB':>8}" if args.trace_memory else ''))
+        for scenario in scenarios:
+            app = scenario.name == 'app rerun'
+            result = scenario.run(
+                args.reruns if app else args.requests,
+                1 if app else args.concurrency,  # an AppTest is one browser session
+                args.trace_memory
+            )
+            results.append(result)
+            print(f"{result['scenario']:<26} {result['requests']:>5} {result['errors']:>4} {result['throughput']:>8.1f}"
+                  f" {result['p50'] * 1000:>8.1f} {result['p95'] * 1000:>8.1f} {result['p99'] * 1000:>8.1f}"
+                  f" {result['peak_rss_mb']:>7.0f}"
+                  + (f" {result['traced_peak_mb']:>8.1f}" if args.trace_memory else ''))
+
+    stages = stage_summary()
+    if stages:
+        print(f"\n{'render stage':<26} {'count':>5} {'~p50 ms':>8} {'~p95 ms':>8}")
+        for name, count, p50, p95 in stages:
+            print(f"{name:<26} {count:>5} {p50 * 1000:>8.1f} {p95 * 1000:>8.1f}")
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Login latency: full /users scan vs the indexed lookup in api.get_user_by_username.
+
+Run from the repository root:
+
+    python benchmarks/bench_login.py --users 10000 100000
+"""
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+import api
+from stub_api import create_app, serve
+
+
+def legacy_get_user_by_username(session, username):
+    """The pre-index implementation: download every user and scan"""
+    response = session.get(f"{api.BASE_URL}/users")
+    for user in response.json():
+        if user.get('name') == username:
+            return user
+    return None
+
+
+def time_logins(lookup, session, names):
+    timings = []
+    for name in names:
+        start = time.perf_counter()
+        user = lookup(session, name)
+        timings.append(time.perf_counter() - start)
+        assert user is not None and user['name'] == name
+    return timings
+
+
+def report(label, timings):
+    ms = sorted(t * 1000 for t in timings)
+    print(f"  {label:<28} first {timings[0] * 1000:8.2f} ms   "
+          f"median {statistics.median(ms):8.2f} ms   p95 {ms[int(len(ms) * 0.95) - 1]:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--logins', type=int, default=50)
+    args = parser.parse_args()
+    # api.py turns on DEBUG logging at import; the app disables it the same way
+    logging.disable(logging.DEBUG)
+
+    for num_users in args.users:
+        print(f"{num_users:,} users, {args.logins} logins")
+        rng = random.Random(num_users)
+        names = [f"user{rng.randint(1, num_users)}@example.com" for _ in range(args.logins)]
+        for user_filter in (True, False):
+            with serve(create_app(num_users=num_users, user_filter=user_filter)) as base_url:
+                api.BASE_URL = base_url
+                session = requests.Session()
+                mode = 'server filter' if user_filter else 'shared index'
+                report('legacy full scan', time_logins(legacy_get_user_by_username, session, names))
+                api.get_user_index.clear()
+                report(f'indexed ({mode})', time_logins(api.get_user_by_username, session, names))
+
+
+if __name__ == '__main__':
+    main()
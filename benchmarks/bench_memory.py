@@ -0,0 +1,62 @@
+"""Memory held per cached user: JSON dicts vs the columnar AnnotationBatch.
+
+Sizes are the Python heap (tracemalloc) plus Arrow memory pool growth while
+the object is alive, for annotations decoded from JSON the way the API client
+receives them.
+
+    python benchmarks/bench_memory.py --rows 100000
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import tracemalloc
+
+import pyarrow as pa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api
+from batch import AnnotationBatch
+from search import AnnotationIndex
+from stub_api import make_annotations
+
+
+def retained(build, *args):
+    """Bytes still allocated by build(*args) once it returns, and the result"""
+    gc.collect()
+    arrow_start = pa.total_allocated_bytes()
+    tracemalloc.start()
+    result = build(*args)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] + pa.total_allocated_bytes() - arrow_start
+    tracemalloc.stop()
+    return size, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    args = parser.parse_args()
+    logging.disable(logging.DEBUG)
+
+    payload = json.dumps(make_annotations(args.rows))
+    per = 100_000 / args.rows / 2 ** 20
+
+    records_size, records = retained(json.loads, payload)
+    batch_size, batch = retained(AnnotationBatch.from_records, records)
+    frames_size, _ = retained(api.get_price_history_data, batch)
+    index_size, _ = retained(AnnotationIndex, batch)
+
+    print(f"{args.rows:,} annotations, MB per 100k")
+    print(f"  list of JSON dicts       {records_size * per:8.1f}")
+    print(f"  AnnotationBatch          {batch_size * per:8.1f}   ({records_size / batch_size:.1f}x smaller)")
+    print(f"    of which column data   {batch.nbytes * per:8.1f}")
+    print(f"  price history frame      {frames_size * per:8.1f}")
+    print(f"  search index             {index_size * per:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""get_price_history_data: the old row-by-row dateutil loop vs the columnar pipeline.
+
+The columnar time is split into building the AnnotationBatch (done once per
+fetch and shared with search) and building the frames from it.
+
+    python benchmarks/bench_price_history.py --rows 1000000
+"""
+import argparse
+import datetime
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+import api
+from batch import AnnotationBatch
+from stub_api import make_annotations
+
+
+def legacy_get_price_history_data(annotations):
+    """The implementation replaced by the columnar pipeline"""
+    data = []
+    for ann in annotations:
+        if ann.get('itemName') and ann.get('price') and ann.get('timestamp'):
+            data.append({
+                'itemName': ann['itemName'],
+                'price': float(ann['price']),
+                'timestamp': api.parse_timestamp(ann['timestamp']),
+                'annotation_name': ann['name'],
+                'quantity': float(ann.get('quantity', 1))
+            })
+
+    df = pd.DataFrame(data)
+    if not df.empty:
+        df = df.sort_values('timestamp')
+        df['total_spent'] = df['price'] * df['quantity']
+        df['cumulative_sum'] = df.groupby('itemName')['total_spent'].cumsum()
+        df['overall_cumulative_sum'] = df['total_spent'].cumsum()
+
+    return df if not df.empty else None
+
+
+def timed(func, annotations):
+    start = time.perf_counter()
+    df = func(annotations)
+    return df, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+    logging.disable(logging.DEBUG)
+
+    annotations = make_annotations(args.rows)
+    # A few rows the real API can produce: missing fields and a non-ISO timestamp
+    annotations[::1000] = [dict(a, price=None) for a in annotations[::1000]]
+    annotations[1::1000] = [
+        dict(a, timestamp=datetime.datetime.fromisoformat(a['timestamp']).strftime('%m/%d/%Y %H:%M:%S'))
+        for a in annotations[1::1000]
+    ]
+
+    batch, batch_time = timed(AnnotationBatch.from_records, annotations)
+    new_df, frame_time = timed(api.get_price_history_data, batch)
+    new_time = batch_time + frame_time
+    old_df, old_time = timed(legacy_get_price_history_data, annotations)
+
+    pd.testing.assert_frame_equal(
+        new_df.astype({'itemName': object, 'annotation_name': object}),
+        old_df.reset_index(drop=True), check_dtype=False, check_index_type=False)
+    print(f"{args.rows:,} annotations")
+    print(f"  legacy row loop + dateutil  {old_time:8.2f} s")
+    print(f"  columnar pipeline           {new_time:8.2f} s   ({old_time / new_time:.0f}x)")
+    print(f"    AnnotationBatch           {batch_time:8.2f} s")
+    print(f"    price history frames      {frame_time:8.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Latency of the canned "A.I. way" search examples with and without the local fast path.
+
+The stub adds --ai-latency seconds to every search, standing in for the
+backend's LLM. The search cache is cleared before every query so each
+measurement is a cold question.
+
+    python benchmarks/bench_search.py --ai-latency 1.5
+"""
+import argparse
+import datetime
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+import api
+from stub_api import create_app, serve
+
+USER_ID = 1
+
+
+def canned_queries():
+    """The examples offered on the Search Food page"""
+    formatted_date = datetime.datetime.now().strftime("%d %B %Y")
+    return [
+        "Select the food with name apple",
+        "Select the food with name apple with a minimum quantity of 1 kilo at any time",
+        f"Get the total price of food apple in the last 15 days; today is {formatted_date}",
+        f"Get the total price of food apple in the last month; today is {formatted_date} and price is USD",
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ai-latency', type=float, default=1.5)
+    parser.add_argument('--history', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.DEBUG)
+    # Every run starts a fresh stub; a disk copy from an earlier run would not match it
+    api.ANNOTATION_STORE_DIR = ''
+
+    app = create_app(num_users=10, annotations_per_user=args.history, ai_latency=args.ai_latency)
+    with serve(app) as base_url:
+        api.BASE_URL = base_url
+        session = requests.Session()
+        api.get_waste_annotations(session, USER_ID)
+        for fast_path in (False, True):
+            api.LOCAL_SEARCH = fast_path
+            print(f"local fast path {'on' if fast_path else 'off'}")
+            for query in canned_queries():
+                timings = []
+                for _ in range(args.repeat):
+                    api.get_search_cache().clear()
+                    start = time.perf_counter()
+                    results = api.search_waste_annotations(session, USER_ID, {'query': query})
+                    timings.append(time.perf_counter() - start)
+                print(f"  {statistics.median(timings) * 1000:9.1f} ms  {query[:60]}")
+                if results.get('reply'):
+                    print(f"  {'':>12}{results['reply']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""Concurrent headless browser sessions rerunning app.py against the stub API.
+
+Each of N threads is one household: it logs in as its own user and clicks
+through a realistic sequence (pages, a quick add, the price history charts, a
+search), every click being a full rerun of app.py on that thread, as on a
+Streamlit server. For each N it reports per-rerun latency, process CPU (in
+cores) and RSS, and the time spent in shared resources that serialise the
+sessions:
+
+- locale: locale.setlocale, process-global and not thread-safe
+- logging: waiting for logging handler locks
+- http pool: waiting for a free connection of the shared, blocking pool
+
+A cpu column that stays near 1.0 while latency grows with N means the reruns
+are bound by the interpreter lock rather than by any of the above.
+
+    python benchmarks/bench_sessions.py --sessions 1 2 4 8 16 --rounds 3
+"""
+import argparse
+import contextlib
+import functools
+import locale
+import logging
+import os
+import resource
+import statistics
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import streamlit as st
+import urllib3
+from streamlit import config
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.secrets import Secrets
+from streamlit.testing.v1 import AppTest
+from unittest import mock
+
+import api
+from stub_api import spawn
+
+ACCESS_TOKEN = 'bench'
+
+
+class Probe:
+    """Total time and call count spent inside one shared resource, across threads"""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def wrap(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.calls += 1
+                    self.seconds += elapsed
+        return wrapper
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.seconds = 0.0
+
+
+@contextlib.contextmanager
+def probes():
+    """Patch the shared resources with timing wrappers for the duration of the run"""
+    patches = [
+        (locale, 'setlocale', Probe('locale')),
+        (logging.Handler, 'acquire', Probe('logging')),
+        (urllib3.HTTPConnectionPool, '_get_conn', Probe('http pool')),
+    ]
+    originals = [getattr(owner, name) for owner, name, _ in patches]
+    for owner, name, probe in patches:
+        setattr(owner, name, probe.wrap(getattr(owner, name)))
+    try:
+        yield [probe for _, _, probe in patches]
+    finally:
+        for (owner, name, _), original in zip(patches, originals):
+            setattr(owner, name, original)
+
+
+@contextlib.contextmanager
+def shared_runtime():
+    """One runtime, one set of secrets and one config for every AppTest, as on a real server.
+
+    AppTest swaps these process globals in and out around each run, which
+    breaks runs on other threads; pin them for the whole benchmark instead.
+    """
+    runtime = mock.MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    secrets = Secrets()
+    secrets._secrets = {'api_key': 'bench', 'access_token': ACCESS_TOKEN}
+    config.set_option('global.appTest', True)
+    with mock.patch.object(Runtime, 'instance', return_value=runtime), \
+            mock.patch.object(Runtime, 'exists', return_value=True), \
+            mock.patch.object(st, 'secrets', secrets), \
+            mock.patch('streamlit.testing.v1.app_test.patch_config_options', lambda options: contextlib.nullcontext()):
+        yield runtime
+
+
+def widget(elements, label):
+    for element in elements:
+        if element.label == label:
+            return element
+    raise LookupError(f"no widget {label!r} on the page")
+
+
+def browser_session(user_number, rounds, timings, errors):
+    """One household clicking through the app; appends the duration of every rerun"""
+    app = AppTest.from_file(os.path.join(ROOT, 'app.py'), default_timeout=300)
+    app.query_params['token'] = ACCESS_TOKEN
+
+    def rerun(action):
+        start = time.perf_counter()
+        action()
+        timings.append(time.perf_counter() - start)
+        if app.exception:
+            errors.append(app.exception[0].message)
+
+    def go_to(page):
+        rerun(lambda: widget(app.sidebar.selectbox, "Go to").select(page).run())
+
+    rerun(app.run)
+    widget(app.text_input, "Enter email").input(f"user{user_number}@example.com")
+    rerun(widget(app.button, "Login").click().run)
+    for round_number in range(rounds):
+        go_to("Food")
+        rerun(widget(app.number_input, "Page").set_value(round_number + 2).run)
+        rerun(widget(app.radio, "View").set_value("Table" if round_number % 2 == 0 else "List").run)
+        widget(app.text_input, "Enter text or use voice input:").input(f"Add {round_number + 1} apples at 1 USD each")
+        rerun(widget(app.button, "Quick Add Food Item").click().run)
+        go_to("Price History")
+        item = widget(app.selectbox, "Select Item")
+        rerun(item.select(item.options[round_number % len(item.options)]).run)
+        aggregate = widget(app.selectbox, "Aggregate by")
+        rerun(aggregate.select(aggregate.options[(round_number + 1) % len(aggregate.options)]).run)
+        go_to("Search Food")
+        widget(app.text_input, "Item Name (optional)").input("apple")
+        rerun(widget(app.button, "Search Food Items").click().run)
+
+
+def current_rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_sessions(count, rounds, first_user, probes):
+    timings = []  # list.append is atomic, no lock needed
+    errors = []
+    for probe in probes:
+        probe.reset()
+    def session(user_number):
+        try:
+            browser_session(user_number, rounds, timings, errors)
+        except Exception as e:
+            errors.append(f"session aborted: {e!r}")
+
+    threads = [threading.Thread(target=session, args=(first_user + i,)) for i in range(count)]
+    cpu_start = cpu_seconds()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    cuts = statistics.quantiles(timings, n=100, method='inclusive')
+    return {
+        'sessions': count,
+        'reruns': len(timings),
+        'errors': errors,
+        'reruns_per_s': len(timings) / wall,
+        'p50': cuts[49],
+        'p95': cuts[94],
+        'p99': cuts[98],
+        'cpu_cores': (cpu_seconds() - cpu_start) / wall,
+        'rss_mb': current_rss_mb(),
+        'contention': {probe.name: (probe.calls, probe.seconds) for probe in probes},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--rounds', type=int, default=2, help='click sequences per session')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--history', type=int, default=2000, help='annotations per user')
+    parser.add_argument('--latency', type=float, default=0.02, help='gateway round trip, seconds')
+    parser.add_argument('--ai-latency', type=float, default=0.0, help='extra seconds on AI-backed endpoints')
+    args = parser.parse_args()
+    logging.disable(logging.DEBUG)
+    # app.py opens its images relative to the working directory, like `streamlit run` from the repo
+    os.chdir(ROOT)
+    api.ANNOTATION_STORE_DIR = ''
+
+    with spawn(users=args.users, annotations=args.history, latency=args.latency,
+               ai_latency=args.ai_latency) as base_url, shared_runtime(), probes() as shared:
+        api.BASE_URL = base_url
+        print(f"{'sessions':>8} {'reruns':>6} {'/s':>6} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7}"
+              f" {'cpu':>5} {'rss MB':>7}  " + '  '.join(f"{probe.name + ' ms/rerun':>18}" for probe in shared))
+        first_user = 1
+        for count in args.sessions:
+            # Fresh users each step, so every step starts from cold annotation caches
+            result = run_sessions(count, args.rounds, first_user, shared)
+            first_user += count
+            contention = '  '.join(
+                f"{seconds * 1000 / result['reruns']:>18.2f}" for _, seconds in result['contention'].values()
+            )
+            print(f"{count:>8} {result['reruns']:>6} {result['reruns_per_s']:>6.1f} {result['p50'] * 1000:>7.0f}"
+                  f" {result['p95'] * 1000:>7.0f} {result['p99'] * 1000:>7.0f} {result['cpu_cores']:>5.2f}"
+                  f" {result['rss_mb']:>7.0f}  {contention}")
+            for error in sorted(set(result['errors'])):
+                print(f"    error: {error}")
+
+
+if __name__ == '__main__':
+    main()
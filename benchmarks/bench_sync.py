@@ -0,0 +1,71 @@
+"""Full vs delta annotation sync: bytes transferred and latency per refresh.
+
+Each round the stub adds one annotation and deletes one (another device of
+the same household), then the client refreshes its expired cache entry.
+
+    python benchmarks/bench_sync.py --history 1000 10000 50000
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+import api
+from stub_api import create_app, serve
+
+USER_ID = 1
+
+
+def run(base_url, app, mode, rounds):
+    api.BASE_URL = base_url
+    api.ANNOTATION_SYNC = mode
+    api.get_annotation_cache.clear()
+    api.get_annotation_cache().ttl = 0  # every call is a refresh
+
+    received = []
+    session = requests.Session()
+    session.hooks['response'].append(lambda r, *args, **kwargs: received.append(len(r.content)))
+
+    initial = len(api.get_waste_annotations(session, USER_ID))
+    store = app.state.store_for(USER_ID)
+    received.clear()
+
+    timings = []
+    for i in range(rounds):
+        store.add({'name': 'other device', 'description': f'round {i}', 'itemName': 'apple',
+                   'price': 1.0, 'quantity': 1})
+        store.delete(next(iter(store.annotations)))
+        start = time.perf_counter()
+        annotations = api.get_waste_annotations(session, USER_ID)
+        timings.append(time.perf_counter() - start)
+        assert len(annotations) == initial == len(store.annotations)
+        assert set(annotations.ids.tolist()) == set(store.annotations)
+    return sum(received) / rounds, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--history', type=int, nargs='+', default=[1000, 10_000, 50_000])
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+    logging.disable(logging.DEBUG)
+    # Every run starts a fresh stub; a disk copy from an earlier run would not match it
+    api.ANNOTATION_STORE_DIR = ''
+
+    print(f"{'history':>8} {'mode':>6} {'bytes/refresh':>14} {'median ms':>10}")
+    for history in args.history:
+        for mode in ('full', 'delta'):
+            app = create_app(num_users=10, annotations_per_user=history)
+            with serve(app) as base_url:
+                size, latency = run(base_url, app, mode, args.rounds)
+            print(f"{history:>8,} {mode:>6} {size:>14,.0f} {latency * 1000:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
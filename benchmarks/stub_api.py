@@ -0,0 +1,338 @@
+"""Local stand-in for the Food Meter API gateway, for offline benchmarks.
+
+    app = create_app(num_users=10_000)
+    with serve(app) as base_url:
+        api.BASE_URL = base_url
+        ...
+
+Or run it standalone and point the app at it (base_url=http://127.0.0.1:8000,
+openai_base_url=http://127.0.0.1:8000/v1):
+
+    python benchmarks/stub_api.py --port 8000
+
+spawn() does the same in a child process, keeping the stub's CPU and memory
+out of the measurements of the process under test.
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import itertools
+import json
+import random
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, File, Form, Header, Response, UploadFile
+from fastapi.middleware.gzip import GZipMiddleware
+
+ITEMS = [
+    'apple', 'banana', 'peach', 'biscuits', 'milk', 'bread', 'rice', 'eggs',
+    'cheese', 'tomato', 'potato', 'onion', 'chicken', 'yogurt', 'pasta', 'coffee',
+]
+
+
+def make_users(count, seed=0):
+    """Synthetic users shaped like the real /users payload"""
+    rng = random.Random(seed)
+    return [
+        {
+            'id': i + 1,
+            'name': f"user{i + 1}@example.com",
+            'numberOfOps': rng.randint(0, 500),
+        }
+        for i in range(count)
+    ]
+
+
+def make_annotations(count, user_name='user1@example.com', seed=0, days=3 * 365, start_id=1):
+    """Synthetic annotations spread evenly over the last `days` days, oldest first"""
+    rng = random.Random(seed)
+    now = datetime.datetime.now().replace(microsecond=0)
+    step = datetime.timedelta(days=days) / max(count, 1)
+    annotations = []
+    for i in range(count):
+        item = rng.choice(ITEMS)
+        quantity = rng.randint(1, 5)
+        price = round(rng.uniform(0.5, 20), 2)
+        annotations.append({
+            'id': start_id + i,
+            'name': user_name,
+            'description': f"Add {quantity} {item} at {price} USD each",
+            'itemName': item,
+            'price': price,
+            'quantity': quantity,
+            'timestamp': (now - step * (count - i)).isoformat(),
+        })
+    return annotations
+
+
+class AnnotationStore:
+    """One user's annotations with change tracking for the delta protocol"""
+
+    def __init__(self, annotations):
+        self.annotations = {a['id']: a for a in annotations}
+        self.modified = {a['id']: a['timestamp'] for a in annotations}
+        self.tombstones = {}  # id -> deletion time
+        self.version = 0
+        self._ids = itertools.count(max(self.annotations, default=0) + 1)
+
+    @staticmethod
+    def now():
+        return datetime.datetime.now().isoformat()
+
+    @property
+    def etag(self):
+        return f'"{self.version}"'
+
+    def watermark(self):
+        return max(itertools.chain(self.modified.values(), self.tombstones.values()), default=None)
+
+    def add(self, annotation):
+        annotation = dict(annotation, id=next(self._ids), timestamp=self.now())
+        self.annotations[annotation['id']] = annotation
+        self.modified[annotation['id']] = annotation['timestamp']
+        self.version += 1
+        return annotation
+
+    def delete(self, annotation_id):
+        if self.annotations.pop(annotation_id, None) is None:
+            return False
+        del self.modified[annotation_id]
+        self.tombstones[annotation_id] = self.now()
+        self.version += 1
+        return True
+
+    def changes_since(self, since):
+        return {
+            'annotations': [self.annotations[i] for i, ts in self.modified.items() if ts > since],
+            'deleted': [i for i, ts in self.tombstones.items() if ts > since],
+            'watermark': self.watermark(),
+        }
+
+
+def search(annotations, params):
+    """Structured filters as the real search endpoint applies them.
+
+    A free-text 'query' is matched naively: every known item it mentions.
+    """
+    item = (params.get('itemName') or '').lower()
+    items = {item} if item else set()
+    if params.get('query'):
+        items |= {name for name in ITEMS if name in params['query'].lower()}
+    start = params.get('startDate')
+    # endDate is inclusive: compare against the next day
+    end = params.get('endDate') and (
+        datetime.date.fromisoformat(params['endDate']) + datetime.timedelta(days=1)).isoformat()
+    return [
+        a for a in annotations
+        if (not items or (a['itemName'] or '').lower() in items)
+        and (not start or a['timestamp'] >= start)
+        and (not end or a['timestamp'] < end)
+        and (params.get('minPrice') is None or a['price'] >= params['minPrice'])
+        and (params.get('maxPrice') is None or a['price'] <= params['maxPrice'])
+        and (params.get('minQuantity') is None or a['quantity'] >= params['minQuantity'])
+        and (params.get('maxQuantity') is None or a['quantity'] <= params['maxQuantity'])
+    ]
+
+
+def create_app(num_users=1000, latency=0.0, user_filter=True, annotations_per_user=100,
+               delta=True, batch=True, ai_latency=0.0, upload_bandwidth=None, seed=0,
+               jitter=0.0, compress=False):
+    """Build the stub app.
+
+    latency: seconds added to every response, to mimic the remote gateway
+    jitter: up to this many extra seconds per response, uniformly random
+    user_filter: honour GET /users?name=... (the real API may not)
+    annotations_per_user: size of each user's generated history
+    delta: honour ?since= and If-None-Match on the annotation list
+    batch: serve POST .../wasteannotations/batch (404 otherwise)
+    ai_latency: extra seconds per request on endpoints the real API sends to an LLM
+    upload_bandwidth: bytes/s charged for transcription uploads, to mimic a
+        household uplink (loopback is otherwise free)
+    compress: gzip responses over 1 KB (level 6, a typical gateway setting) for
+        clients that send Accept-Encoding: gzip
+
+    POST /v1/audio/transcriptions stands in for OpenAI: point the client at it
+    with OPENAI_BASE_URL=<base_url>/v1.
+    """
+    app = FastAPI()
+    if compress:
+        app.add_middleware(GZipMiddleware, minimum_size=1000, compresslevel=6)
+    users = make_users(num_users, seed)
+    app.state.users = users
+    stores = {}
+    app.state.annotations = stores
+
+    def store_for(user_id):
+        if user_id not in stores:
+            name = users[user_id - 1]['name'] if 0 < user_id <= len(users) else None
+            stores[user_id] = AnnotationStore(
+                make_annotations(annotations_per_user, name, seed=seed + user_id,
+                                 start_id=user_id * 10_000_000)
+            )
+        return stores[user_id]
+    app.state.store_for = store_for
+
+    rng = random.Random(seed)
+
+    async def delay():
+        if latency or jitter:
+            await asyncio.sleep(latency + rng.uniform(0, jitter))
+
+    @app.get('/users')
+    async def list_users(name: str = None):
+        await delay()
+        if name is not None and user_filter:
+            return [user for user in users if user['name'] == name][:1]
+        return users
+
+    @app.get('/users/{user_id}/wasteannotations')
+    async def list_annotations(user_id: int, since: str = None,
+                               if_none_match: str = Header(None)):
+        await delay()
+        store = store_for(user_id)
+        headers = {'ETag': store.etag} if delta else {}
+        if delta and if_none_match == store.etag:
+            return Response(status_code=304, headers=headers)
+        if delta and since:
+            return Response(content=_dumps(store.changes_since(since)),
+                            media_type='application/json', headers=headers)
+        return Response(content=_dumps(list(store.annotations.values())),
+                        media_type='application/json', headers=headers)
+
+    @app.post('/users/{user_id}/wasteannotations', status_code=201)
+    async def create_annotation(user_id: int, annotation: dict):
+        await delay()
+        await asyncio.sleep(ai_latency)
+        return store_for(user_id).add(annotation)
+
+    @app.post('/users/{user_id}/wasteannotations/batch', status_code=201)
+    async def create_annotations(user_id: int, annotations: list[dict]):
+        if not batch:
+            return Response(status_code=404)
+        await delay()
+        await asyncio.sleep(ai_latency)
+        store = store_for(user_id)
+        return [store.add(annotation) for annotation in annotations]
+
+    @app.delete('/users/{user_id}/wasteannotations/{annotation_id}')
+    async def delete_annotation(user_id: int, annotation_id: int):
+        await delay()
+        if not store_for(user_id).delete(annotation_id):
+            return Response(status_code=404)
+        return Response(status_code=200)
+
+    app.state.search_requests = 0
+
+    @app.post('/users/{user_id}/wasteannotations/search')
+    async def search_annotations(user_id: int, search_params: dict):
+        await delay()
+        await asyncio.sleep(ai_latency)
+        app.state.search_requests += 1
+        matches = search(store_for(user_id).annotations.values(), search_params)
+        reply = None
+        if 'query' in search_params:
+            total = sum(a['price'] * a['quantity'] for a in matches)
+            reply = f"{len(matches)} items, total price {total:.2f}"
+        return {'reply': reply, 'wasteAnnotations': matches}
+
+    @app.patch('/api/users/{user_id}/increment-ops', status_code=204)
+    async def increment_ops(user_id: int):
+        await delay()
+        if not 0 < user_id <= len(users):
+            return Response(status_code=404)
+        users[user_id - 1]['numberOfOps'] += 1
+        return Response(status_code=204)
+
+    @app.post('/v1/audio/transcriptions')
+    async def transcribe(file: UploadFile = File(...), model: str = Form('whisper-1'),
+                         language: str = Form(None), prompt: str = Form(None)):
+        audio = await file.read()
+        if upload_bandwidth:
+            await asyncio.sleep(len(audio) / upload_bandwidth)
+        await asyncio.sleep(ai_latency)
+        return {'text': f"stub transcript of {file.filename} ({len(audio)} bytes)"}
+
+    return app
+
+
+def _dumps(payload):
+    return json.dumps(payload, separators=(',', ':'))
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def serve(app, port=None):
+    """Run app with uvicorn in a background thread and yield its base URL"""
+    port = port or _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+@contextlib.contextmanager
+def spawn(port=None, **options):
+    """Run the stub in a child process and yield its base URL.
+
+    options are the command line flags below, e.g. spawn(users=10_000, latency=0.05).
+    """
+    port = port or _free_port()
+    command = [sys.executable, os.path.abspath(__file__), '--port', str(port)]
+    for name, value in options.items():
+        flag = f"--{name.replace('_', '-')}"
+        if isinstance(value, bool):
+            command += [flag] if value else []
+        else:
+            command += [flag, str(value)]
+    process = subprocess.Popen(command)
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            with contextlib.suppress(OSError), socket.create_connection(('127.0.0.1', port), timeout=1):
+                break
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"stub API did not start: {' '.join(command)}")
+            time.sleep(0.05)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the stub Food Meter API')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--annotations', type=int, default=100, help='annotations per user')
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--ai-latency', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compress', action='store_true', help='gzip responses')
+    args = parser.parse_args()
+    uvicorn.run(
+        create_app(num_users=args.users, annotations_per_user=args.annotations,
+                   latency=args.latency, jitter=args.jitter,
+                   ai_latency=args.ai_latency, seed=args.seed, compress=args.compress),
+        host='127.0.0.1',
+        port=args.port,
+        log_level='warning',
+    )
@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire ttl seconds after being stored.
+
+    Instances are meant to be shared between Streamlit sessions through
+    st.cache_resource, so every operation takes the lock. Hits, misses and
+    evictions are counted so the cache can be sized from real traffic.
+    """
+
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()  # key -> (stored_at, value), least recently used first
+        self._lock = threading.RLock()
+
+    def _expired(self, stored_at):
+        return self.ttl is not None and time.monotonic() - stored_at > self.ttl
+
+    def get(self, key, default=None):
+        """Return a fresh value for key, or default (counted as a miss)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or self._expired(entry[0]):
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def peek(self, key, default=None):
+        """Return the value for key even if expired, without touching stats or LRU order"""
+        with self._lock:
+            entry = self._data.get(key)
+            return default if entry is None else entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def update(self, key, func):
+        """Replace the value for key with func(value); drop the entry if func returns None.
+
+        The entry keeps its original age: a local edit does not make the rest
+        of the cached value any more current. Expired values are edited too,
+        so the edit is still there for whatever revalidates them from peek().
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return
+            value = func(entry[1])
+            if value is None:
+                del self._data[key]
+            else:
+                self._data[key] = (entry[0], value)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return default if entry is None else entry[1]
+
+    def discard(self, predicate):
+        """Drop every entry whose key matches predicate"""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class SingleFlight:
+    """Collapses concurrent calls that share a key into a single execution.
+
+    The first caller for a key runs func; callers arriving while it is in
+    flight wait for and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+        if not leader:
+            return call.result()
+
+        try:
+            result = func()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
@@ -0,0 +1,118 @@
+import os
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import streamlit as st
+from api import get_item_history
+
+# Most points sent to the browser per trace; longer series are downsampled
+CHART_POINT_BUDGET = int(os.getenv('chart_point_budget', 2000))
+# Cumulative figures kept per process (user, data version and options)
+CHART_CACHE_SIZE = int(os.getenv('chart_cache_size', 64))
+
+AGGREGATIONS = {
+    "None": None,
+    "Day": "D",
+    "Week": "W",
+    "Month": "ME",
+}
+
+def lttb_indices(x, y, threshold):
+    """Indices of the points kept by Largest-Triangle-Three-Buckets downsampling.
+
+    x and y are numeric 1-d arrays of the same length, x ascending. The first
+    and last points are always kept; each bucket in between contributes the
+    point forming the largest triangle with the previously kept point and the
+    average of the next bucket, which preserves peaks and the overall shape.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # Bucket boundaries for the n - 2 interior points
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    starts, ends = edges[:-1], edges[1:]
+    # Average point of every bucket, used as the third triangle vertex
+    counts = ends - starts
+    avg_x = np.add.reduceat(x[1:n - 1], starts - 1) / counts
+    avg_y = np.add.reduceat(y[1:n - 1], starts - 1) / counts
+    avg_x = np.append(avg_x, x[-1])
+    avg_y = np.append(avg_y, y[-1])
+
+    kept = np.empty(threshold, dtype=int)
+    kept[0] = 0
+    previous = 0
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        bucket_x = x[start:end]
+        bucket_y = y[start:end]
+        area = np.abs(
+            (x[previous] - avg_x[i + 1]) * (bucket_y - y[previous])
+            - (x[previous] - bucket_x) * (avg_y[i + 1] - y[previous])
+        )
+        previous = start + int(area.argmax())
+        kept[i + 1] = previous
+    kept[-1] = n - 1
+    return kept
+
+def downsample_series(series, point_budget=CHART_POINT_BUDGET):
+    """Downsample a time-indexed Series to at most point_budget points with LTTB"""
+    series = series[series.index.notna()]
+    if len(series) <= point_budget:
+        return series
+    x = series.index.asi8 if isinstance(series.index, pd.DatetimeIndex) else series.index.to_numpy()
+    return series.iloc[lttb_indices(x, series.to_numpy(), point_budget)]
+
+def aggregate_series(series, freq):
+    """Last cumulative value per day/week/month; periods without data are skipped"""
+    if freq is None:
+        return series
+    series = series[series.index.notna()]
+    return series.resample(freq).last().dropna()
+
+def cumulative_trace(series, point_budget=CHART_POINT_BUDGET, **kwargs):
+    """Scatter trace for a cumulative series, switched to Scattergl when downsampled"""
+    trace = go.Scattergl if len(series) > point_budget else go.Scatter
+    series = downsample_series(series, point_budget)
+    return trace(x=series.index, y=series.to_numpy(), **kwargs)
+
+@st.cache_resource(max_entries=CHART_CACHE_SIZE, show_spinner=False)
+def get_cumulative_figure(user_id, data_version, aggregate, point_budget, _frames):
+    """Cumulative spending figure for get_price_history_frames output.
+
+    Cached on (user_id, data_version, aggregate, point_budget); the figure is
+    shared between sessions and must not be modified.
+    """
+    freq = AGGREGATIONS[aggregate]
+    df = _frames['df'].set_index('timestamp')
+    fig_cumsum = go.Figure()
+
+    # Add overall cumulative sum line
+    fig_cumsum.add_trace(cumulative_trace(
+        aggregate_series(df['overall_cumulative_sum'], freq),
+        point_budget,
+        mode='lines',
+        name='Total Cumulative Spending',
+        line=dict(width=3, color='black')
+    ))
+
+    # Add individual item cumulative sums
+    for item in _frames['items']:
+        item_data = get_item_history(_frames, item).set_index('timestamp')
+        fig_cumsum.add_trace(cumulative_trace(
+            aggregate_series(item_data['cumulative_sum'], freq),
+            point_budget,
+            mode='lines+markers',
+            name=f'{item} Cumulative',
+            marker=dict(size=8)
+        ))
+
+    fig_cumsum.update_layout(
+        title='Cumulative Spending Over Time',
+        xaxis_title='Date',
+        yaxis_title='Cumulative Spending',
+        hovermode='x unified',
+        showlegend=True
+    )
+    return fig_cumsum
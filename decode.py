@@ -0,0 +1,109 @@
+import json
+import logging
+import os
+from typing import Optional, Union
+import requests
+
+try:
+    # Optional: typed decoding straight into structs, the fastest path
+    import msgspec
+except ImportError:
+    msgspec = None
+try:
+    # Optional: a faster drop-in for json.loads
+    import orjson
+except ImportError:
+    orjson = None
+
+# 'auto' uses msgspec, else orjson, else the standard library; or force one of them
+JSON_DECODER = os.getenv('json_decoder', 'auto')
+
+
+def _pick_decoder(name):
+    available = {'msgspec': msgspec is not None, 'orjson': orjson is not None, 'json': True}
+    if name == 'auto':
+        return next(decoder for decoder, ok in available.items() if ok)
+    if not available.get(name):
+        logging.warning(f"JSON decoder {name!r} is not available, using the standard library")
+        return 'json'
+    return name
+
+DECODER = _pick_decoder(JSON_DECODER)
+
+# What the decoders raise on a body that is not JSON (orjson's error is a ValueError)
+_DECODE_ERRORS = (ValueError, msgspec.DecodeError) if msgspec is not None else (ValueError,)
+
+
+if msgspec is not None:
+    class Annotation(msgspec.Struct):
+        """One annotation as the API sends it; unknown fields are ignored"""
+        id: Union[int, str, None] = None
+        name: Optional[str] = None
+        description: Optional[str] = None
+        itemName: Optional[str] = None
+        price: Optional[float] = None
+        quantity: Optional[float] = None
+        timestamp: Optional[str] = None
+
+    class AnnotationDelta(msgspec.Struct):
+        annotations: list[Annotation] = []
+        deleted: list[Union[int, str]] = []
+        watermark: Optional[str] = None
+
+    class SearchResults(msgspec.Struct):
+        reply: Optional[str] = None
+        wasteAnnotations: Optional[list[Annotation]] = None
+
+    _annotation_decoder = msgspec.json.Decoder(Union[list[Annotation], AnnotationDelta])
+    _search_decoder = msgspec.json.Decoder(SearchResults)
+    _untyped_decoder = msgspec.json.Decoder()
+
+
+def _invalid_json(error):
+    # A RequestException, like the one response.json() raises, so callers' handlers report it
+    return requests.exceptions.InvalidJSONError(f"Invalid JSON in response: {error}")
+
+def loads(content):
+    """Decode a JSON response body (bytes) into plain Python objects"""
+    try:
+        if DECODER == 'msgspec':
+            return _untyped_decoder.decode(content)
+        if DECODER == 'orjson':
+            return orjson.loads(content)
+        return json.loads(content)
+    except _DECODE_ERRORS as e:
+        raise _invalid_json(e) from e
+
+def decode_annotations(content):
+    """Decode a GET .../wasteannotations body.
+
+    Returns a list of annotations (Annotation structs with msgspec, dicts
+    otherwise) or a delta dict {'annotations', 'deleted', 'watermark'}.
+    Like every function here, raises requests' InvalidJSONError when the
+    body is not JSON (e.g. a gateway error page).
+    """
+    if DECODER == 'msgspec':
+        try:
+            payload = _annotation_decoder.decode(content)
+        except msgspec.ValidationError as e:
+            # Valid JSON but not the shape we expect (e.g. prices as strings)
+            logging.debug(f"Typed annotation decode failed, decoding untyped: {e}")
+            return loads(content)
+        except msgspec.DecodeError as e:
+            raise _invalid_json(e) from e
+        if isinstance(payload, AnnotationDelta):
+            return msgspec.structs.asdict(payload)
+        return payload
+    return loads(content)
+
+def decode_search_results(content):
+    """Decode a search response into {'reply', 'wasteAnnotations'} (annotations as in decode_annotations)"""
+    if DECODER == 'msgspec':
+        try:
+            return msgspec.structs.asdict(_search_decoder.decode(content))
+        except msgspec.ValidationError as e:
+            logging.debug(f"Typed search decode failed, decoding untyped: {e}")
+            return loads(content)
+        except msgspec.DecodeError as e:
+            raise _invalid_json(e) from e
+    return loads(content)
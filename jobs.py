@@ -0,0 +1,144 @@
+import itertools
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+from api import (
+    add_cached_annotation, discard_cached_annotation, post_waste_annotation, post_waste_annotations_batch,
+    remove_cached_annotation, remove_waste_annotation, restore_cached_annotation,
+    submit_in_script_context
+)
+
+# Annotation POSTs and DELETEs in flight at once, across every session of the process
+SUBMISSION_WORKERS = int(os.getenv('submission_workers', 4))
+# Seconds between status refreshes while a session has jobs in flight
+SUBMISSION_POLL_INTERVAL = float(os.getenv('submission_poll_interval', 1))
+
+_job_ids = itertools.count(1)
+# Leading bullets or numbering of pasted lists and receipts: "- ", "* ", "• ", "3. ", "3) "
+_LIST_MARKER = re.compile(r'^\s*(?:[-*•]|\d+[.)])\s+')
+
+
+class SubmissionJob:
+    """One annotation added or deleted in the background and its current status.
+
+    The worker thread only ever assigns status, error and finished_at, so the
+    script thread can read a job at any time without locking.
+    """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, description):
+        self.id = next(_job_ids)
+        self.description = description
+        self.status = self.PENDING
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+
+@st.cache_resource
+def get_submission_executor():
+    """Thread pool shared by every Streamlit session; bounds concurrent POSTs"""
+    return ThreadPoolExecutor(max_workers=SUBMISSION_WORKERS, thread_name_prefix='submission')
+
+
+def submit_annotation(session, user_id, annotation_data, jobs, optimistic=False):
+    """Queue annotation_data for creation and append its job to jobs; returns immediately.
+
+    With optimistic, the annotation is added to the cached list at once under
+    a provisional id, replaced by the created one when the POST succeeds and
+    removed again if it fails.
+    """
+    job = SubmissionJob(annotation_data.get('description'))
+    jobs.append(job)
+    provisional_id = add_cached_annotation(user_id, annotation_data) if optimistic else None
+    submit_in_script_context(
+        get_submission_executor(), _run_submission, job, session, user_id, annotation_data, provisional_id
+    )
+    return job
+
+
+def _run_submission(job, session, user_id, annotation_data, provisional_id=None):
+    job.status = SubmissionJob.RUNNING
+    try:
+        created, error = post_waste_annotation(session, user_id, annotation_data, replaces=provisional_id)
+    except Exception as e:
+        created, error = False, str(e)
+    if not created and provisional_id is not None:
+        discard_cached_annotation(user_id, provisional_id)
+    job.error = error
+    job.finished_at = time.time()
+    job.status = SubmissionJob.DONE if created else SubmissionJob.FAILED
+
+
+def submit_annotation_delete(session, user_id, annotation_id, description, jobs):
+    """Remove an annotation from the cached list now and DELETE it in the background.
+
+    The rerun that follows already renders without it, with no refetch. If
+    the DELETE fails the row is put back and the job shows the error.
+    """
+    job = SubmissionJob(f"Delete: {description}")
+    jobs.append(job)
+    removed = remove_cached_annotation(user_id, annotation_id)
+    submit_in_script_context(get_submission_executor(), _run_delete, job, session, user_id, annotation_id, removed)
+    return job
+
+
+def _run_delete(job, session, user_id, annotation_id, removed):
+    job.status = SubmissionJob.RUNNING
+    try:
+        deleted, error = remove_waste_annotation(session, user_id, annotation_id)
+    except Exception as e:
+        deleted, error = False, str(e)
+    if not deleted:
+        restore_cached_annotation(user_id, annotation_id, removed)
+    job.error = error
+    job.finished_at = time.time()
+    job.status = SubmissionJob.DONE if deleted else SubmissionJob.FAILED
+
+
+def split_batch_text(text):
+    """One description per non-empty line of pasted text, without list markers"""
+    lines = (_LIST_MARKER.sub('', line).strip() for line in text.splitlines())
+    return [line for line in lines if line]
+
+
+def submit_annotation_batch(session, user_id, annotations, jobs):
+    """Queue several annotations at once, with one job per annotation.
+
+    They are sent as a single batched POST when the API supports it, and
+    otherwise as concurrent single POSTs on the shared pool.
+    """
+    batch_jobs = [SubmissionJob(annotation.get('description')) for annotation in annotations]
+    jobs.extend(batch_jobs)
+    submit_in_script_context(get_submission_executor(), _run_batch, batch_jobs, session, user_id, annotations)
+    return batch_jobs
+
+
+def _run_batch(batch_jobs, session, user_id, annotations):
+    for job in batch_jobs:
+        job.status = SubmissionJob.RUNNING
+    try:
+        results = post_waste_annotations_batch(session, user_id, annotations)
+    except Exception as e:
+        results = [(False, str(e))] * len(annotations)
+    if results is None:
+        executor = get_submission_executor()
+        for job, annotation_data in zip(batch_jobs, annotations):
+            submit_in_script_context(executor, _run_submission, job, session, user_id, annotation_data)
+        return
+    # A short reply means the API dropped the tail of the batch
+    results += [(False, "No result returned")] * (len(batch_jobs) - len(results))
+    for job, (created, error) in zip(batch_jobs, results):
+        job.error = error
+        job.finished_at = time.time()
+        job.status = SubmissionJob.DONE if created else SubmissionJob.FAILED
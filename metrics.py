@@ -0,0 +1,182 @@
+import bisect
+import contextlib
+import functools
+import os
+import re
+import threading
+import time
+import uuid
+
+# Upper bounds of the latency buckets, in seconds, and of the payload size buckets, in bytes
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+# When set, the Prometheus text is also written here after every rerun
+# (for node_exporter's textfile collector)
+METRICS_TEXTFILE = os.getenv('metrics_textfile')
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile by linear interpolation inside its bucket"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """Process-wide histograms and counters, shared by every Streamlit session.
+
+    Collectors are callables returning extra (name, labels, value) samples at
+    export time, used for numbers that already live elsewhere such as cache
+    hit counters.
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def add_collector(self, collector):
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def histograms(self):
+        with self._lock:
+            return dict(self._histograms)
+
+    def samples(self):
+        """Counter and collector samples as (name, labels dict, value)"""
+        with self._lock:
+            counters = list(self._counters.items())
+            collectors = list(self._collectors)
+        samples = [(name, dict(labels), value) for (name, labels), value in counters]
+        for collector in collectors:
+            samples.extend(collector())
+        return samples
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), histogram in sorted(self.histograms().items()):
+            declare(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(dict(labels, le=bound))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(dict(labels))} {histogram.sum}")
+            lines.append(f"{name}_count{_labels(dict(labels))} {histogram.count}")
+        for name, labels, value in sorted(self.samples(), key=lambda s: (s[0], sorted(s[1].items()))):
+            declare(name, 'counter' if name.endswith('_total') else 'gauge')
+            lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        # Unique per call: every session of the process writes after its reruns, on its own thread
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'w') as f:
+            f.write(self.render_prometheus())
+        os.replace(temp_path, path)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items())) + '}'
+
+
+def cache_samples(cache_name, stats):
+    """Samples for a cache.TTLCache.stats() dict"""
+    return [
+        ('foodmeter_cache_hits_total', {'cache': cache_name}, stats['hits']),
+        ('foodmeter_cache_misses_total', {'cache': cache_name}, stats['misses']),
+        ('foodmeter_cache_evictions_total', {'cache': cache_name}, stats['evictions']),
+        ('foodmeter_cache_entries', {'cache': cache_name}, stats['size']),
+    ]
+
+
+REGISTRY = MetricsRegistry()
+
+
+def timed(name, **labels):
+    """Decorator recording the duration of every call in histogram name"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with REGISTRY.timer(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def stage(name):
+    """Time a render stage of app.main: `with stage("chart build"): ...`"""
+    return REGISTRY.timer('foodmeter_render_stage_seconds', stage=name)
+
+
+# Numeric path segments become {id}, keeping the endpoint label cardinality bounded
+_PATH_IDS = re.compile(r'/\d+(?=/|$)')
+
+
+def record_response(response, *args, **kwargs):
+    """requests response hook: latency and payload size per endpoint and status"""
+    path = _PATH_IDS.sub('/{id}', response.request.path_url.split('?')[0])
+    endpoint = f"{response.request.method} {path}"
+    REGISTRY.observe('foodmeter_http_request_seconds', response.elapsed.total_seconds(),
+                     endpoint=endpoint, status=response.status_code)
+    REGISTRY.observe('foodmeter_http_response_bytes', len(response.content),
+                     buckets=SIZE_BUCKETS, endpoint=endpoint)
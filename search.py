@@ -0,0 +1,185 @@
+import datetime
+import re
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+# Structured filters the local index understands; anything else goes to the server
+STRUCTURED_SEARCH_KEYS = {
+    'itemName', 'startDate', 'endDate', 'minPrice', 'maxPrice', 'minQuantity', 'maxQuantity'
+}
+
+# Aggregate questions answered locally, e.g. the canned
+# "Get the total price of food apple in the last 15 days; today is 18 October 2026"
+_AGGREGATE_QUESTION = re.compile(r"""
+    ^\s*(?:(?:get|show|give\s+me|tell\s+me|what\s+is|what's)\s+)?(?:the\s+)?
+    (?P<aggregate>total\s+(?:price|cost|spent|spending)|average\s+price|total\s+quantity
+        |number\s+of\s+(?:purchases|entries|items)|count)
+    \s+of\s+(?:(?:the\s+)?(?:food|item)\s+)?(?P<item>[a-z][a-z -]*?)
+    \s+(?:in|over|during|for)\s+the\s+(?:last|past)\s+(?:(?P<count>\d+|a|an|one|two|three|four|five|six|seven|eight|nine|ten|twelve)\s+)?
+    (?P<unit>day|week|month|year)s?\b
+    (?P<rest>.*)$
+""", re.IGNORECASE | re.VERBOSE)
+# Clauses allowed after the time window; anything else needs the AI
+_QUESTION_CONTEXT = re.compile(
+    r"\s*[;,.]?\s*(?:and\s+)?(?:today\s+is\s+(?P<today>\d{1,2}\s+[a-z]+\s+\d{4})|price\s+is\s+[a-z]{3})",
+    re.IGNORECASE
+)
+_NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+    'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'twelve': 12,
+}
+_AGGREGATE_KINDS = {'total': 'total', 'average': 'average', 'number': 'count', 'count': 'count'}
+
+class AnnotationIndex:
+    """Sorted views of a user's AnnotationBatch for answering structured searches locally.
+
+    Timestamps and prices are kept as sorted arrays with their row order, so a
+    range filter is two binary searches; item names are hashed to row
+    positions. Filters are combined as boolean masks and results are returned
+    in the original annotation order.
+    """
+
+    def __init__(self, batch):
+        self.batch = batch
+        ts = batch.timestamps.astype(np.int64)
+        # NaT is the smallest int64; keep those rows out of every date range
+        self._has_ts = ~np.isnat(batch.timestamps)
+        self._ts_order = np.argsort(ts, kind='stable')
+        self._ts_sorted = ts[self._ts_order]
+
+        self._price_order = np.argsort(batch.prices, kind='stable')  # NaN sorts last
+        self._price_sorted = batch.prices[self._price_order]
+
+        self._quantity = batch.quantities
+
+        # Group on the category codes, then name the groups by lowercase category,
+        # merging categories that differ only by case
+        items = batch.item_names
+        lower = pd.Series(items.categories.astype(str)).str.lower().to_numpy()
+        self._items = {}
+        for code, rows in pd.Series(items.codes).groupby(items.codes, sort=False).indices.items():
+            name = lower[code] if code >= 0 else ''
+            self._items[name] = np.sort(np.concatenate([self._items[name], rows])) if name in self._items else rows
+
+    def __len__(self):
+        return len(self.batch)
+
+    def item_name(self, name):
+        """The indexed (lowercase) item name matching name, also for simple plurals"""
+        name = name.lower().strip()
+        for candidate in (name, name[:-1] if name.endswith('s') else None,
+                          name[:-2] if name.endswith('es') else None):
+            if candidate and candidate in self._items:
+                return candidate
+        return None
+
+    def _range(self, order, values, low, high):
+        """Mask of rows with low <= value <= high, by binary search on sorted values"""
+        start = 0 if low is None else np.searchsorted(values, low, side='left')
+        # NaN (missing price) sorts last and never matches a range
+        stop = np.searchsorted(values, np.inf if high is None else high, side='right')
+        mask = np.zeros(len(values), dtype=bool)
+        mask[order[start:stop]] = True
+        return mask
+
+    def search(self, search_params):
+        """AnnotationBatch of the rows matching the structured search_params, like the search endpoint"""
+        mask = np.ones(len(self), dtype=bool)
+
+        item = (search_params.get('itemName') or '').lower()
+        if item:
+            mask[:] = False
+            mask[self._items.get(item, [])] = True
+
+        start_date = search_params.get('startDate')
+        end_date = search_params.get('endDate')
+        if start_date or end_date:
+            low = _day_start(start_date) if start_date else None
+            # endDate is inclusive: everything before the start of the next day
+            high = _day_start(end_date, days=1) - 1 if end_date else None
+            mask &= self._has_ts & self._range(self._ts_order, self._ts_sorted, low, high)
+
+        if search_params.get('minPrice') is not None or search_params.get('maxPrice') is not None:
+            mask &= self._range(self._price_order, self._price_sorted,
+                                search_params.get('minPrice'), search_params.get('maxPrice'))
+
+        if search_params.get('minQuantity') is not None:
+            mask &= self._quantity >= search_params['minQuantity']
+        if search_params.get('maxQuantity') is not None:
+            mask &= self._quantity <= search_params['maxQuantity']
+
+        return self.batch.take(mask)
+
+def _day_start(date_str, days=0):
+    """Nanoseconds since the epoch at midnight of a 'YYYY-MM-DD' date"""
+    day = datetime.date.fromisoformat(date_str) + datetime.timedelta(days=days)
+    return np.datetime64(day, 'ns').astype(np.int64)
+
+def parse_aggregate_question(query, today=None):
+    """Recognise "total/average/count of <item> in the last <n> <unit>s" questions.
+
+    Returns {'aggregate', 'item', 'startDate', 'endDate', 'window'} or None when
+    the question is anything else. A "today is 18 October 2026" clause sets the
+    end of the window; otherwise today is used.
+    """
+    match = _AGGREGATE_QUESTION.match(query or '')
+    if match is None:
+        return None
+    rest = match.group('rest')
+    for clause in _QUESTION_CONTEXT.finditer(rest):
+        if clause.group('today'):
+            try:
+                today = datetime.datetime.strptime(clause.group('today'), '%d %B %Y').date()
+            except ValueError:
+                return None
+    if _QUESTION_CONTEXT.sub('', rest).strip(' ;,.?!'):
+        return None
+
+    today = today or datetime.date.today()
+    unit = match.group('unit').lower()
+    count = match.group('count') or '1'
+    count = int(count) if count.isdigit() else _NUMBER_WORDS[count.lower()]
+    window = f"last {count} {unit}s" if count != 1 else f"last {unit}"
+    start = today - relativedelta(**{f'{unit}s': count})
+    aggregate = match.group('aggregate').lower()
+    if aggregate == 'total quantity':
+        kind = 'quantity'
+    else:
+        kind = _AGGREGATE_KINDS[aggregate.split()[0]]
+    return {
+        'aggregate': kind,
+        'item': match.group('item').strip(),
+        'startDate': start.isoformat(),
+        'endDate': today.isoformat(),
+        'window': window,
+    }
+
+def answer_aggregate_question(index, question):
+    """Search response for a parse_aggregate_question result, or None if the item is unknown"""
+    item = index.item_name(question['item'])
+    if item is None:
+        # Maybe a synonym or category only the AI can resolve
+        return None
+    matches = index.search({
+        'itemName': item,
+        'startDate': question['startDate'],
+        'endDate': question['endDate'],
+    })
+    price = pd.Series(matches.prices)
+    quantity = pd.Series(matches.quantities).fillna(1.0)
+    window = question['window']
+    if question['aggregate'] == 'total':
+        reply = f"The total price of {item} in the {window} is {(price * quantity).sum():.2f}."
+    elif question['aggregate'] == 'average':
+        average = price.mean()
+        reply = (f"The average price of {item} in the {window} is {average:.2f}."
+                 if pd.notna(average) else f"No {item} with a price in the {window}.")
+    elif question['aggregate'] == 'quantity':
+        reply = f"The total quantity of {item} in the {window} is {quantity.sum():g}."
+    else:
+        reply = f"{len(matches)} {item} entries in the {window}."
+    return {'reply': reply, 'wasteAnnotations': matches.to_frame()}
+
+def is_structured_search(search_params):
+    return bool(search_params) and set(search_params) <= STRUCTURED_SEARCH_KEYS
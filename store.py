@@ -0,0 +1,108 @@
+import logging
+import os
+import threading
+import time
+import uuid
+import pyarrow as pa
+from batch import ARROW_SCHEMA, AnnotationBatch
+from sync import AnnotationSet, provisional_rows
+
+class AnnotationStore:
+    """Per-user annotations persisted as Arrow IPC files, read back memory-mapped.
+
+    Each file also records the sync watermark and ETag in its schema metadata,
+    so after a restart only the changes since the file was written need to be
+    fetched. Files of users idle longer than max_idle seconds are removed, and
+    the least recently used ones go once the directory exceeds max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes, max_idle):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, user_id):
+        return os.path.join(self.directory, f"{user_id}.arrow")
+
+    def load(self, user_id):
+        """The stored AnnotationSet of a user, or None"""
+        path = self.path(user_id)
+        try:
+            with pa.memory_map(path) as source:
+                table = pa.ipc.open_file(source).read_all()
+            # Loading counts as activity for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, pa.ArrowInvalid) as e:
+            logging.warning(f"Ignoring unreadable annotation store file {path}: {e}")
+            return None
+        if not table.schema.remove_metadata().equals(ARROW_SCHEMA):
+            logging.warning(f"Ignoring annotation store file {path} with an unknown layout")
+            return None
+        metadata = table.schema.metadata or {}
+        return AnnotationSet(
+            AnnotationBatch.from_arrow(table),
+            watermark=_decode(metadata.get(b'watermark')),
+            etag=_decode(metadata.get(b'etag')),
+        )
+
+    def save(self, user_id, annotation_set):
+        """Write a user's annotations atomically, then enforce the size cap"""
+        batch = annotation_set.batch
+        provisional = provisional_rows(batch)
+        if provisional.any():
+            # Optimistic adds still being posted: a restart must not bring them back
+            batch = batch.take(~provisional)
+        try:
+            table = batch.to_arrow()
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            logging.warning(f"Not persisting annotations of user {user_id}: {e}")
+            return
+        metadata = {
+            key: value for key, value in
+            (('watermark', annotation_set.watermark), ('etag', annotation_set.etag))
+            if value is not None
+        }
+        table = table.replace_schema_metadata(metadata)
+
+        path = self.path(user_id)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with pa.OSFile(temp_path, 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(temp_path, path)
+            self.evict()
+        except OSError as e:
+            # A full disk or read-only directory only costs the next cold start
+            logging.warning(f"Not persisting annotations of user {user_id}: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def evict(self):
+        """Remove idle users' files, then the least recently used until under max_bytes"""
+        with self._lock:
+            files = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.arrow'):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+            files.sort()
+            now = time.time()
+            total = sum(size for _, size, _ in files)
+            for mtime, size, path in files:
+                if total <= self.max_bytes and now - mtime <= self.max_idle:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+def _decode(value):
+    return value.decode() if value is not None else None
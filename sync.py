@@ -0,0 +1,161 @@
+import itertools
+import threading
+import time
+import numpy as np
+import pandas as pd
+from batch import AnnotationBatch
+
+_versions = itertools.count(1)
+
+
+class AnnotationSet:
+    """A user's annotations together with what is needed to fetch only changes.
+
+    watermark is the newest change the client has seen (the server's
+    'watermark' when it sends one, otherwise the newest 'timestamp'), etag the
+    validator of the last full or delta response. The annotations themselves
+    are one columnar AnnotationBatch. Instances are never modified in place;
+    every change returns a new set, so batches handed out to earlier reruns
+    stay valid. version is unique per content and is what derived data
+    (DataFrames, charts) is cached under.
+    """
+
+    def __init__(self, batch, watermark=None, etag=None, version=None):
+        self.batch = batch
+        self.watermark = watermark
+        self.etag = etag
+        self.version = next(_versions) if version is None else version
+
+    @classmethod
+    def from_full(cls, annotations, etag=None):
+        """annotations: the API's list of annotation dicts"""
+        return cls(AnnotationBatch.from_records(annotations), _newest_timestamp(annotations), etag)
+
+    def merge(self, changed, deleted=(), watermark=None, etag=None):
+        """Apply a delta: upsert changed annotations by id and drop tombstoned ids.
+
+        changed is a list of annotation dicts (or decoded structs) or an
+        AnnotationBatch; a batch needs an explicit watermark.
+        """
+        if watermark is None:
+            watermark = max(filter(None, (self.watermark, _newest_timestamp(changed))), default=None)
+        deleted = list(deleted)
+        if not len(changed) and not np.isin(self.batch.ids, deleted).any():
+            # Nothing to apply: keep the same batch and version
+            return AnnotationSet(self.batch, watermark, etag or self.etag, self.version)
+        if not isinstance(changed, AnnotationBatch):
+            changed = AnnotationBatch.from_records(changed)
+        combined = AnnotationBatch.concat([self.batch, changed])
+        # The last row of each id wins, at the position of its first row, so
+        # updates stay in place and new annotations go to the end
+        rows = pd.Series(np.arange(len(combined))).groupby(combined.ids, sort=False, dropna=False).last()
+        rows = rows[~rows.index.isin(deleted)]
+        return AnnotationSet(combined.take(rows.to_numpy()), watermark, etag or self.etag)
+
+    def with_annotation(self, annotation):
+        return self.merge([annotation], watermark=self.watermark)
+
+    def without(self, annotation_id):
+        return self.merge([], [annotation_id], watermark=self.watermark)
+
+    def restore(self, rows):
+        """Put back rows (an AnnotationBatch) removed by a local edit the API then refused"""
+        return self.merge(rows, watermark=self.watermark)
+
+
+def is_provisional(annotation_id):
+    """True for the id of a locally added annotation that is still being posted"""
+    return isinstance(annotation_id, (int, np.integer)) and annotation_id < 0
+
+def provisional_rows(batch):
+    """Boolean mask of the rows shown ahead of their POST (negative ids)"""
+    if batch.ids.dtype.kind in 'iu':
+        return batch.ids < 0
+    return np.fromiter(map(is_provisional, batch.ids), dtype=bool, count=len(batch))
+
+
+class LocalEdits:
+    """Optimistic adds and deletes of every user, which a sync must not undo.
+
+    An edit is pending from the moment it is shown until the API answers.
+    What the API then confirmed is kept for keep seconds more, for syncs
+    whose response may predate it. apply() lays all of these over a freshly
+    synced AnnotationSet and drops provisional rows whose POST is over.
+    Hold lock across every change here together with the matching cache
+    write, so an answer cannot land between a sync's apply() and its write.
+    """
+
+    def __init__(self, keep):
+        self.keep = keep
+        self.lock = threading.RLock()
+        self._pending = {}    # user_id -> {id: annotation dict of an add, or None for a delete}
+        self._confirmed = {}  # user_id -> [(confirmed_at, created annotation or None, deleted id or None)]
+
+    def add(self, user_id, annotation):
+        with self.lock:
+            self._pending.setdefault(user_id, {})[annotation['id']] = annotation
+
+    def delete(self, user_id, annotation_id):
+        with self.lock:
+            self._pending.setdefault(user_id, {})[annotation_id] = None
+
+    def resolve(self, user_id, edit_id, created=None, deleted=None):
+        """The API answered the pending edit edit_id (or None); record what it created or deleted"""
+        with self.lock:
+            pending = self._pending.get(user_id, {})
+            pending.pop(edit_id, None)
+            if not pending:
+                self._pending.pop(user_id, None)
+            if created is not None or deleted is not None:
+                self._confirmed.setdefault(user_id, []).append((time.monotonic(), created, deleted))
+
+    def apply(self, user_id, annotation_set, since):
+        """annotation_set with the user's edits on top; since is when its sync started (time.monotonic())"""
+        with self.lock:
+            confirmed = [
+                edit for edit in self._confirmed.pop(user_id, [])
+                if edit[0] > time.monotonic() - self.keep
+            ]
+            if confirmed:
+                self._confirmed[user_id] = confirmed
+            pending = self._pending.get(user_id, {})
+            recent = [edit for edit in confirmed if edit[0] >= since]
+            changed = [annotation for annotation in pending.values() if annotation is not None]
+            changed += [created for _, created, _ in recent if created is not None]
+            deleted = [annotation_id for annotation_id, annotation in pending.items() if annotation is None]
+            deleted += [annotation_id for _, _, annotation_id in recent if annotation_id is not None]
+            batch = annotation_set.batch
+            # Provisional rows carried over from before their POST answered
+            deleted += [annotation_id for annotation_id in batch.ids[provisional_rows(batch)].tolist()
+                        if annotation_id not in pending]
+        return annotation_set.merge(changed, deleted, watermark=annotation_set.watermark)
+
+
+def _newest_timestamp(annotations):
+    # ISO-8601 strings from the API sort chronologically as plain strings
+    timestamps = (a.get('timestamp') if isinstance(a, dict) else a.timestamp for a in annotations)
+    return max(filter(None, timestamps), default=None)
+
+
+def parse_sync_response(current, payload, etag=None):
+    """Turn a GET .../wasteannotations body into an AnnotationSet.
+
+    A plain list is a full snapshot (servers without delta support ignore
+    'since'). An object is a delta:
+        {"annotations": [...changed...], "deleted": [ids], "watermark": "..."}
+    """
+    if isinstance(payload, list) or current is None:
+        if isinstance(payload, dict):
+            payload = payload.get('annotations', [])
+        snapshot = AnnotationSet.from_full(payload, etag)
+        if current is not None and snapshot.batch.equals(current.batch):
+            # Unchanged (a server that ignores 'since' and ETags): keep the
+            # version, so frames, indexes and the stored copy are not rebuilt
+            return AnnotationSet(current.batch, snapshot.watermark, etag, current.version)
+        return snapshot
+    return current.merge(
+        payload.get('annotations', []),
+        payload.get('deleted', []),
+        payload.get('watermark'),
+        etag,
+    )
@@ -0,0 +1,11 @@
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import sounddevice
+except (ImportError, OSError):
+    # No PortAudio here (CI containers); audio.py only needs it to record
+    sys.modules['sounddevice'] = types.ModuleType('sounddevice')
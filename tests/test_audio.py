@@ -0,0 +1,67 @@
+import io
+
+import numpy as np
+import scipy.io.wavfile as wav
+
+from audio import TRANSCRIPTION_SAMPLE_RATE, VAD_PADDING, detect_speech, prepare_audio, voiced_frames
+
+RATE = 44100
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * RATE), dtype=np.int16)
+
+
+def tone(seconds, frequency=220, amplitude=8000):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.int16)
+
+
+def noise(seconds, amplitude=4000, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.clip(rng.normal(0, amplitude, int(seconds * RATE)), -32768, 32767).astype(np.int16)
+
+
+def test_silence_has_no_voiced_frames():
+    recording = silence(1.5)
+    assert not voiced_frames(recording, RATE).any()
+    assert detect_speech(recording, RATE) is None
+    assert prepare_audio(recording, RATE) is None
+
+
+def test_broadband_noise_is_rejected_by_zcr_ceiling():
+    recording = noise(1.5)
+    # Loud enough for the energy threshold on its own
+    assert voiced_frames(recording, RATE, zcr_max=1.0).all()
+    assert not voiced_frames(recording, RATE).any()
+    assert detect_speech(recording, RATE) is None
+    assert prepare_audio(recording, RATE) is None
+
+
+def test_short_burst_is_not_speech():
+    recording = np.concatenate([silence(0.5), tone(0.1), silence(0.5)])
+    assert detect_speech(recording, RATE) is None
+
+
+def test_tone_burst_is_cropped_with_padding():
+    recording = np.concatenate([silence(0.5), tone(0.6), silence(0.8)])
+    start, end = detect_speech(recording, RATE)
+    frame = int(0.02 * RATE)
+    pad = int(VAD_PADDING * RATE)
+    assert abs(start - (int(0.5 * RATE) - pad)) <= frame
+    assert abs(end - (int(1.1 * RATE) + pad)) <= frame
+
+
+def test_padding_is_clipped_to_the_recording():
+    recording = np.concatenate([tone(0.5), silence(0.05)])
+    assert detect_speech(recording, RATE) == (0, len(recording))
+
+
+def test_prepare_audio_crops_and_resamples():
+    recording = np.concatenate([silence(0.5), tone(0.6), silence(0.8)])
+    filename, data = prepare_audio(recording.reshape(-1, 1), RATE, audio_format='wav')
+    assert filename == 'recording.wav'
+    rate, samples = wav.read(io.BytesIO(data))
+    assert rate == TRANSCRIPTION_SAMPLE_RATE
+    expected = (0.6 + 2 * VAD_PADDING) * TRANSCRIPTION_SAMPLE_RATE
+    assert abs(len(samples) - expected) <= 0.02 * TRANSCRIPTION_SAMPLE_RATE
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from batch import AnnotationBatch
+
+
+def test_mixed_utc_offsets_are_converted_to_naive_utc():
+    # A history spanning a DST change
+    batch = AnnotationBatch.from_records([
+        {'id': 1, 'timestamp': '2024-03-30T10:00:00+01:00'},
+        {'id': 2, 'timestamp': '2024-04-01T10:00:00+02:00'},
+        {'id': 3, 'timestamp': '2024-04-02T10:00:00'},
+        {'id': 4, 'timestamp': None},
+    ])
+    assert batch.timestamps.dtype == np.dtype('datetime64[ns]')
+    assert [record['timestamp'] for record in batch.to_records()] == [
+        pd.Timestamp('2024-03-30 09:00:00'),
+        pd.Timestamp('2024-04-01 08:00:00'),
+        pd.Timestamp('2024-04-02 10:00:00'),
+        None,
+    ]
+    assert pd.api.types.is_datetime64_dtype(batch.to_frame()['timestamp'])
+
+
+def test_empty_batch():
+    batch = AnnotationBatch.from_records([])
+    assert len(batch) == 0
+    assert batch.timestamps.dtype == np.dtype('datetime64[ns]')
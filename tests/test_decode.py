@@ -0,0 +1,37 @@
+import pytest
+import requests
+
+import decode
+
+DECODERS = [name for name, module in (('json', True), ('orjson', decode.orjson), ('msgspec', decode.msgspec)) if module]
+GATEWAY_ERROR_PAGE = b"<html><body><h1>502 Bad Gateway</h1></body></html>"
+
+
+@pytest.fixture(params=DECODERS)
+def decoder(request, monkeypatch):
+    monkeypatch.setattr(decode, 'DECODER', request.param)
+    return request.param
+
+
+@pytest.mark.parametrize('function', [decode.loads, decode.decode_annotations, decode.decode_search_results])
+def test_non_json_body_raises_request_exception(decoder, function):
+    with pytest.raises(requests.exceptions.RequestException):
+        function(GATEWAY_ERROR_PAGE)
+
+
+def test_annotation_list(decoder):
+    annotations = decode.decode_annotations(b'[{"id": 1, "itemName": "apple", "price": 1.5, "extra": true}]')
+    annotation = annotations[0]
+    fields = annotation if isinstance(annotation, dict) else decode.msgspec.structs.asdict(annotation)
+    assert (fields['id'], fields['itemName'], fields['price']) == (1, 'apple', 1.5)
+
+
+def test_delta_is_a_dict(decoder):
+    delta = decode.decode_annotations(b'{"annotations": [], "deleted": [3], "watermark": "2024-01-01T00:00:00"}')
+    assert delta['deleted'] == [3]
+    assert delta['watermark'] == '2024-01-01T00:00:00'
+
+
+def test_unexpected_shape_falls_back_to_untyped(decoder):
+    annotations = decode.decode_annotations(b'[{"id": 1, "price": "1.50"}]')
+    assert annotations == [{'id': 1, 'price': '1.50'}]
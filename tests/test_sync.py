@@ -0,0 +1,49 @@
+import time
+
+from sync import AnnotationSet, LocalEdits
+
+USER = 1
+
+
+def annotation(annotation_id, item='apple'):
+    return {'id': annotation_id, 'itemName': item, 'price': 1.0, 'timestamp': '2024-01-01T00:00:00'}
+
+
+def snapshot(*ids):
+    return AnnotationSet.from_full([annotation(i) for i in ids])
+
+
+def test_pending_edits_survive_a_full_snapshot():
+    edits = LocalEdits(keep=60)
+    edits.add(USER, annotation(-1, 'pear'))
+    edits.delete(USER, 2)
+    synced = edits.apply(USER, snapshot(1, 2, 3), time.monotonic())
+    assert synced.batch.ids.tolist() == [1, 3, -1]
+
+
+def test_provisional_rows_go_once_their_post_is_answered():
+    edits = LocalEdits(keep=60)
+    edits.add(USER, annotation(-1, 'pear'))
+    stale = snapshot(1).with_annotation(annotation(-1, 'pear'))
+    edits.resolve(USER, -1)
+    assert edits.apply(USER, stale, time.monotonic()).batch.ids.tolist() == [1]
+
+
+def test_answers_during_a_sync_are_applied_to_its_result():
+    edits = LocalEdits(keep=60)
+    edits.add(USER, annotation(-1, 'pear'))
+    edits.delete(USER, 2)
+    started = time.monotonic()
+    # The response was produced before either answer
+    response = snapshot(1, 2)
+    edits.resolve(USER, -1, created=annotation(10, 'pear'), deleted=-1)
+    edits.resolve(USER, 2, deleted=2)
+    synced = edits.apply(USER, response, started)
+    assert synced.batch.ids.tolist() == [1, 10]
+    # A sync started after the answers takes the server's word for it
+    assert edits.apply(USER, snapshot(1, 2), time.monotonic()).batch.ids.tolist() == [1, 2]
+
+
+def test_nothing_to_apply_keeps_the_version():
+    synced = snapshot(1, 2)
+    assert LocalEdits(keep=60).apply(USER, synced, time.monotonic()).version == synced.version